@@ -0,0 +1,266 @@
+"""Offline benchmarks of the splitting pipeline on synthetic recordings.
+
+The recordings are made of tone bursts standing for the words, with pauses between the words and the sentences,
+over a low noise floor, and their exact timestamps are replayed by the local transcription backend, so the results
+are reproducible and no API call is made. Every case runs in a fresh process, so that its peak memory
+is its own.
+
+Run the benchmarks and store the results:
+
+    python benchmarks/bench.py --durations 1 10 60 --output results.json
+
+Compare two runs, failing when a case got slower or bigger by more than the threshold:
+
+    python benchmarks/bench.py --compare baseline.json results.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+from multiprocessing import get_context
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+CASES = ["pipeline", "alignment", "clip_export", "generate_html", "zip"]
+FRAME_RATE = 22050
+VOCABULARY = [
+    "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliett",
+    "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango",
+]  # fmt: skip
+
+
+def make_script(duration, seed=0):
+    """Return the sentences of a synthetic recording of `duration` seconds, as lists of `(word, start, end)`."""
+    rng = np.random.default_rng(seed)
+    sentences, position = [], 0.5
+    while True:
+        sentence = []
+        for _ in range(rng.integers(4, 13)):
+            length = rng.uniform(0.25, 0.45)
+            sentence.append((str(rng.choice(VOCABULARY)), round(position, 3), round(position + length, 3)))
+            position += length + 0.08
+        if sentence[-1][2] > duration - 0.5:
+            return sentences
+        sentences.append(sentence)
+        position += 0.7
+
+
+def render(script, duration, path, seed=0):
+    """Write the tone bursts of the script over a noise floor to a 16-bit mono WAV file."""
+    rng = np.random.default_rng(seed)
+    with wave.open(path, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(FRAME_RATE)
+        words = iter([word for sentence in script for word in sentence])
+        word = next(words, None)
+        # a minute at a time, to bound the memory use for the long recordings
+        for block_start in range(0, int(duration * FRAME_RATE), 60 * FRAME_RATE):
+            block_end = min(block_start + 60 * FRAME_RATE, int(duration * FRAME_RATE))
+            samples = rng.normal(0, 30, block_end - block_start)
+            while word is not None and word[1] * FRAME_RATE < block_end:
+                start, end = int(word[1] * FRAME_RATE), int(word[2] * FRAME_RATE)
+                positions = np.arange(max(start, block_start), min(end, block_end))
+                frequency = 150 + 25 * VOCABULARY.index(word[0])
+                samples[positions - block_start] += 8000 * np.sin(2 * np.pi * frequency * positions / FRAME_RATE)
+                if end > block_end:
+                    break
+                word = next(words, None)
+            file.writeframes(samples.astype("<i2").tobytes())
+
+
+def make_transcript(script, duration):
+    from openai.types.audio import TranscriptionVerbose
+
+    text = " ".join(" ".join(word for word, _, _ in sentence).capitalize() + "." for sentence in script)
+    words = [{"word": word, "start": start, "end": end} for sentence in script for word, start, end in sentence]
+    return TranscriptionVerbose(duration=duration, text=text, language="english", words=words)
+
+
+def _peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _prepare(audio_path, duration, seed):
+    # the sentences and clips of the recording, as the command line computes them
+    from speech_splitter.media import AudioFile
+    from speech_splitter.splitter import get_sentences_as_audio, split_text_into_sentences
+
+    transcript = make_transcript(make_script(duration, seed), duration)
+    sentences = split_text_into_sentences(transcript.text, "english")
+    audio = AudioFile(audio_path)
+    return transcript, sentences, get_sentences_as_audio(sentences, audio, transcript.words, "english")
+
+
+def run_case(case, audio_path, duration, seed, output_dir):
+    """Run a benchmark case, writing its output to `output_dir` and returning its measurements."""
+    from speech_splitter import splitter
+
+    os.makedirs(output_dir)
+    extra = {}
+    if case == "pipeline":
+        transcript = make_transcript(make_script(duration, seed), duration)
+        # the transcription is replayed by the local backend, chunks and concurrency included
+        replay_path = os.path.join(output_dir, "transcript.json")
+        with open(replay_path, "w") as file:
+            file.write(transcript.model_dump_json(include={"language", "text", "words"}))
+        metrics_path = os.path.join(output_dir, "metrics.json")
+        argv = ["speech-split", audio_path, output_dir, "--no-cache", "--backend", "replay", "--replay-file", replay_path]
+        argv += ["--metrics-out", metrics_path, "--log-level", "WARNING"]
+        splitter.ensure_tokenizer_data()
+        rss_before, start = _peak_rss(), time.perf_counter()
+        with mock.patch("sys.argv", argv):
+            splitter.main()
+        wall_time = time.perf_counter() - start
+        with open(metrics_path) as file:
+            extra["stages"] = {stage["stage"]: round(stage["wall_time"], 3) for stage in json.load(file)[0]["stages"]}
+        count = len(transcript.words)
+    elif case == "alignment":
+        transcript = make_transcript(make_script(duration, seed), duration)
+        audio = splitter.AudioFile(audio_path)
+        rss_before, start = _peak_rss(), time.perf_counter()
+        sentences = splitter.split_text_into_sentences(transcript.text, "english")
+        splitter.get_sentences_as_audio(sentences, audio, transcript.words, "english")
+        wall_time = time.perf_counter() - start
+        count = len(transcript.words)
+    elif case == "clip_export":
+        _, sentences, audio_sentences = _prepare(audio_path, duration, seed)
+        rss_before, start = _peak_rss(), time.perf_counter()
+        for _ in splitter.encode_clips([item["audio"] for item in audio_sentences], "64k"):
+            pass
+        wall_time = time.perf_counter() - start
+        count = len(sentences)
+    elif case == "generate_html":
+        _, sentences, audio_sentences = _prepare(audio_path, duration, seed)
+        spinner = SimpleNamespace(next=lambda: None)
+        rss_before, start = _peak_rss(), time.perf_counter()
+        splitter.generate_html(audio_path, sentences, output_dir, "bench", audio_sentences, spinner, 64)
+        wall_time = time.perf_counter() - start
+        count = len(sentences)
+    elif case == "zip":
+        # the zip export of the Streamlit app, which reads the clips from the memory-mapped decoded audio
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from streamlit_app import write_zip_with_audio_fragments
+
+        from speech_splitter.pcm import PcmCache
+
+        transcript = make_transcript(make_script(duration, seed), duration)
+        sentences = splitter.split_text_into_sentences(transcript.text, "english")
+        audio = PcmCache().load(audio_path)
+        audio_sentences = splitter.get_sentences_as_audio(sentences, audio, transcript.words, "english")
+        result = {
+            "title": "bench",
+            "language": "english",
+            "full_text": transcript.text,
+            "sentences": sentences,
+            "audio_sentences": audio_sentences,
+            "audio_bitrate": 64,
+        }
+        rss_before, start = _peak_rss(), time.perf_counter()
+        write_zip_with_audio_fragments(result, "mp3").close()
+        wall_time = time.perf_counter() - start
+        count = len(sentences)
+    else:
+        raise ValueError(f"Unknown benchmark case: {case}")
+    peak_rss = _peak_rss()
+    return {
+        "case": case,
+        "duration": duration,
+        "wall_time": round(wall_time, 3),
+        "items": count,
+        # seconds of audio processed per second
+        "throughput": round(duration / wall_time, 2),
+        "peak_rss": peak_rss,
+        "peak_rss_increase": peak_rss - rss_before,
+        **extra,
+    }
+
+
+def run(durations, cases, seed=0):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # keep the decoded audio of the benchmarks out of the user cache
+        os.environ["SPEECH_SPLITTER_CACHE_DIR"] = os.path.join(temp_dir, "cache")
+        for minutes in durations:
+            duration = minutes * 60
+            audio_path = os.path.join(temp_dir, f"recording_{minutes}min.wav")
+            render(make_script(duration, seed), duration, audio_path, seed)
+            for case in cases:
+                # a fresh process for every case, so that the peak memory is the one of the case
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    future = executor.submit(
+                        run_case, case, audio_path, duration, seed, os.path.join(temp_dir, f"{case}_{minutes}min")
+                    )
+                    result = future.result()
+                print(
+                    f"{case} ({minutes} min): {result['wall_time']:.2f}s, {result['throughput']:.1f}x realtime, "
+                    f"+{result['peak_rss_increase'] / 1e6:.0f} MB"
+                )
+                results.append(result)
+    return {
+        "version": version("speech-splitter"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """Print the changes of every case between two runs, returning the regressions, i.e. the cases more than
+    `threshold` slower or using more than `threshold` more memory."""
+    previous = {(result["case"], result["duration"]): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = (result["case"], result["duration"])
+        if key not in previous:
+            continue
+        changes = []
+        for metric in ("wall_time", "peak_rss_increase"):
+            before, after = previous[key][metric], result[metric]
+            change = (after - before) / before if before else 0
+            changes.append(f"{metric} {before} -> {after} ({change:+.0%})")
+            # ignore the memory noise of the small cases
+            if change > threshold and (metric == "wall_time" or after - before > 16 * 1024 * 1024):
+                regressions.append((key, metric, change))
+        print(f"{key[0]} ({key[1] // 60} min): " + ", ".join(changes))
+    for (case, duration), metric, change in regressions:
+        print(f"REGRESSION: {case} ({duration // 60} min) {metric} {change:+.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the splitting pipeline on synthetic recordings.")
+    parser.add_argument("--durations", type=int, nargs="+", default=[1, 10, 60], help="Recording lengths in minutes.")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES, help="Benchmark cases to run.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic recordings.")
+    parser.add_argument("--output", default="benchmark.json", help="Path of the JSON results.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two JSON results.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as a regression.")
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as baseline, open(args.compare[1]) as current:
+            regressions = compare(json.load(baseline), json.load(current), args.threshold)
+        sys.exit(1 if regressions else 0)
+    report = run(args.durations, args.cases, args.seed)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from pydub.utils import mediainfo
+
+from .cache import file_hash
+from .metrics import record
+from .transport import get_transport
+
+
+def get_client():
+    """Return the asynchronous OpenAI client of the transport, created on first use so that importing the module needs
+    neither the (slow to import) openai package nor the credentials."""
+    # require environment variables
+    if "OPENAI_API_KEY" not in os.environ:
+        raise ValueError("OpenAI API key is not set. Please set the OPENAI_API_KEY environment variable.")
+    return get_transport().client
+
+
+class TranscriptionBackend:
+    """Speech recognition engine, transcribing an audio file to the `(language, text, words)` tuple.
+
+    `name` identifies the engine and its model in the transcription cache keys."""
+
+    name = None
+
+    def transcribe(self, audio_path, offset=0.0):
+        """Transcribe the audio file; `offset` is the position (in seconds) of the file in the whole recording
+        when it's a chunk of it, which only the stand-in backends need."""
+        raise NotImplementedError
+
+
+class OpenAIBackend(TranscriptionBackend):
+    """The OpenAI transcription API."""
+
+    def __init__(self, model="whisper-1"):
+        self.name = model
+
+    def transcribe(self, audio_path, offset=0.0):
+        record("bytes_uploaded", os.path.getsize(audio_path))
+        transcript = get_transport().run(self._transcribe, audio_path)
+        return transcript.language, transcript.text, transcript.words
+
+    async def _transcribe(self, audio_path):
+        # opened again by every attempt, so that a retry uploads the whole file
+        with open(audio_path, "rb") as audio_file:
+            return await get_client().audio.transcriptions.create(
+                model=self.name,
+                file=audio_file,
+                timestamp_granularities=["word"],
+                response_format="verbose_json",
+                timeout=get_transport().timeout,
+                # language="nl",
+            )
+
+
+class ReplayBackend(TranscriptionBackend):
+    """Deterministic local stand-in, replaying the transcription recorded in a JSON file after `latency` seconds,
+    to exercise the whole pipeline offline.
+
+    The file has the `language`, `text` and `words` (with their `word`, `start` and `end`) of the whole recording,
+    like the entries of the transcription cache. Every chunk gets the recorded words falling inside it."""
+
+    def __init__(self, path, latency=0.0):
+        with open(path) as file:
+            self.transcript = json.load(file)
+        self.latency = latency
+        self.name = f"replay-{file_hash(path)[:16]}"
+        self._positions = None
+
+    def transcribe(self, audio_path, offset=0.0):
+        from openai.types.audio import TranscriptionWord
+
+        time.sleep(self.latency)
+        end = offset + float(mediainfo(audio_path).get("duration", 0) or "inf")
+        recorded = self.transcript["words"]
+        indices = [index for index, word in enumerate(recorded) if offset <= word["start"] < end]
+        words = [
+            TranscriptionWord(
+                word=recorded[index]["word"], start=recorded[index]["start"] - offset, end=recorded[index]["end"] - offset
+            )
+            for index in indices
+        ]
+        return self.transcript["language"], self._text(indices), words
+
+    def _text(self, indices):
+        # the recorded text cut around the words of the chunk, keeping the punctuation, which splits the sentences
+        from .splitter import _find_word_positions
+
+        text, recorded = self.transcript["text"], self.transcript["words"]
+        if len(indices) == len(recorded):
+            return text
+        if not indices:
+            return ""
+        if self._positions is None:
+            self._positions = _find_word_positions(text, [SimpleNamespace(word=word["word"]) for word in recorded])
+        first = self._positions[indices[0]]
+        if first is None:
+            return " ".join(recorded[index]["word"] for index in indices)
+        following = [position for position in self._positions[indices[-1] + 1 :] if position is not None]
+        return text[first : following[0] if following else None].strip()
+
+
+BACKENDS = ["openai", "replay"]
+
+
+def create_backend(name="openai", replay_path=None, latency=0.0):
+    """Return the backend of the given name, configured from the options."""
+    if name == "openai":
+        return OpenAIBackend()
+    if name == "replay":
+        if not replay_path:
+            raise ValueError("The replay backend needs the JSON file of the transcription to replay.")
+        return ReplayBackend(replay_path, latency)
+    raise ValueError(f"Unknown transcription backend: {name}")
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 200 * 1024 * 1024
+
+
+def default_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.environ.get("SPEECH_SPLITTER_CACHE_DIR", os.path.join(cache_home, "speech-splitter"))
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """Return the sha256 hex digest of the file content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_file(source, path, block_size=1024 * 1024):
+    """Copy the file object to `path` a block at a time, returning the sha256 hex digest of the content,
+    computed on the way."""
+    digest = hashlib.sha256()
+    with open(path, "wb") as file:
+        for block in iter(lambda: source.read(block_size), b""):
+            digest.update(block)
+            file.write(block)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Directory of cache entries, one file per key, bounded in size by removing the least recently used entries."""
+
+    suffix = ""
+
+    def __init__(self, name, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.join(cache_dir or default_cache_dir(), name)
+        self.max_size = max_size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def touch(self, path):
+        # mark the entry as recently used
+        os.utime(path)
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self._entries():
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+class TranscriptionCache(DiskCache):
+    """Persistent transcription cache, keyed by the hash of the audio content and the transcription options.
+
+    Every entry is a small JSON file with the language, the text and the word timestamps. When the total size
+    of the entries exceeds `max_size` bytes, the least recently used ones are removed."""
+
+    suffix = ".json"
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        super().__init__("transcriptions", cache_dir, max_size)
+
+    def key(self, audio_path, **options):
+        digest = hashlib.sha256(file_hash(audio_path).encode())
+        digest.update(json.dumps(options, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        from openai.types.audio import TranscriptionWord
+
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        self.touch(path)
+        logger.info("\nUsing the cached transcription.")
+        return entry["language"], entry["text"], [TranscriptionWord(**word) for word in entry["words"]]
+
+    def set(self, key, language, text, words):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "language": language,
+            "text": text,
+            "words": [{"word": word.word, "start": word.start, "end": word.end} for word in words],
+        }
+        # write to a temporary file first so that concurrent readers never see a partial entry
+        with tempfile.NamedTemporaryFile("w", dir=self.cache_dir, suffix=".tmp", delete=False) as file:
+            json.dump(entry, file)
+        os.replace(file.name, self._path(key))
+        self.evict()
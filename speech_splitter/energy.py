@@ -0,0 +1,58 @@
+import numpy as np
+
+from .media import AudioFile
+from .pcm import PcmAudio, PcmCache
+
+SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def audio_samples(audio):
+    """Return the samples of the audio as a `(frames, channels)` array, without copying them when possible."""
+    if isinstance(audio, PcmAudio):
+        return audio.array
+    if isinstance(audio, AudioFile):
+        # analyse the memory-mapped decoded file rather than decoding the windows one by one
+        return PcmCache().load(audio.path, audio.frame_rate, audio.channels)[audio.start : audio.end].array
+    samples = np.frombuffer(audio.raw_data, dtype=SAMPLE_TYPES[audio.sample_width]).reshape(-1, audio.channels)
+    if audio.sample_width == 1:
+        samples = samples.astype(np.int16) - 128
+    return samples
+
+
+def window_energy(samples, starts, length):
+    """Return the power of every sample of the mono mix of `samples[start : start + length]` for every start,
+    as a `(len(starts), length)` array; the samples out of bounds count as silence."""
+    positions = np.asarray(starts)[:, None] + np.arange(length)[None, :]
+    inside = (positions >= 0) & (positions < len(samples))
+    region = samples[np.clip(positions, 0, max(len(samples) - 1, 0))].astype(np.float32)
+    region = region.mean(axis=2) if region.ndim == 3 else region
+    return np.where(inside, np.square(region), 0)
+
+
+def refine_boundaries(audio, times, radius=0.2, window=0.02, tolerance=2.0, batch_size=256):
+    """Snap the boundaries (in seconds) to the nearest low-energy valley within `radius` seconds.
+
+    The short-window RMS energy around all the boundaries is computed at once with NumPy, by batches of
+    `batch_size` boundaries to bound the memory use. Among the `window` seconds frames whose energy is within
+    `tolerance` times the quietest one, the frame closest to the original boundary is chosen."""
+    times = np.asarray(times, dtype=np.float64)
+    if not len(times) or radius <= 0:
+        return times
+    samples = audio_samples(audio)
+    frame_rate = audio.frame_rate
+    length = max(int(window * frame_rate), 1)
+    hop = max(length // 2, 1)
+    reach = int(radius * frame_rate) // hop * hop
+    # frame starts relative to the boundary, so that the frames are centered on the candidate positions
+    offsets = np.arange(-reach, reach + 1, hop)
+    refined = np.empty_like(times)
+    for first in range(0, len(times), batch_size):
+        centers = np.round(times[first : first + batch_size] * frame_rate).astype(np.int64)
+        power = window_energy(samples, centers - reach - length // 2, 2 * reach + length)
+        cumulative = np.concatenate([np.zeros((len(centers), 1)), np.cumsum(power, axis=1, dtype=np.float64)], axis=1)
+        frame_starts = offsets + reach
+        energy = (cumulative[:, frame_starts + length] - cumulative[:, frame_starts]) / length
+        candidates = energy <= energy.min(axis=1, keepdims=True) * tolerance + 1e-9
+        distance = np.where(candidates, np.abs(offsets)[None, :], np.iinfo(np.int64).max)
+        refined[first : first + batch_size] = (centers + offsets[distance.argmin(axis=1)]) / frame_rate
+    return np.maximum(refined, 0)
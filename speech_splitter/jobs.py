@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """Processing of a file in the background: its status, the stage it's at and, once finished, its result
+    or the error that stopped it."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = QUEUED
+        self.stage = None
+        # position in the line of the stage, while waiting for it to be admitted
+        self.position = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def progress(self, stage, position=None):
+        """Report the stage the processing is starting, or its position in the line when it waits for it."""
+        self.stage = stage
+        self.position = position
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+
+class JobQueue:
+    """Pool of worker threads running the jobs, and the store of the jobs by ID, shared by all the sessions,
+    so that a client can poll a job or get its result back after reconnecting.
+
+    The finished jobs are kept `ttl` seconds, and only the `max_finished` most recent ones."""
+
+    def __init__(self, max_workers=2, ttl=3600, max_finished=8):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, function, *args, **kwargs):
+        """Queue `function(*args, progress=job.progress, **kwargs)` as the job of the given ID, returning the job and
+        whether the function was submitted.
+
+        A job already submitted with the same ID is returned instead, without submitting the function, unless it
+        failed, in which case it's retried."""
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != FAILED:
+                return job, False
+            job = self._jobs[job_id] = Job(job_id)
+        self._executor.submit(self._run, job, function, args, kwargs)
+        return job, True
+
+    def get(self, job_id):
+        """Return the job of the given ID, or None if it's unknown or expired."""
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def _run(self, job, function, args, kwargs):
+        job.status = RUNNING
+        try:
+            job.result = function(*args, progress=job.progress, **kwargs)
+            status = DONE
+        except Exception as e:
+            logger.exception(f"\nJob {job.id} failed")
+            job.error = e
+            status = FAILED
+        # finished, as seen by the other threads, only once everything is set
+        job.finished_at = time.time()
+        job.status = status
+
+    def _evict(self):
+        finished = [job for job in self._jobs.values() if job.done]
+        expired = [job for job in finished if time.time() - job.finished_at > self.ttl]
+        # the oldest first, the queued and running jobs are never evicted
+        finished.sort(key=lambda job: job.finished_at)
+        expired += finished[: max(len(finished) - self.max_finished, 0)]
+        for job in expired:
+            self._jobs.pop(job.id, None)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
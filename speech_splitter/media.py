@@ -0,0 +1,173 @@
+import logging
+import os
+import subprocess
+
+from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+
+logger = logging.getLogger(__name__)
+
+# largest file accepted by the transcription API
+MAX_UPLOAD_SIZE = 25 * 1024 * 1024
+
+# formats accepted by the transcription API that ffmpeg can cut without re-encoding
+STREAM_COPY_EXTENSIONS = {".mp3", ".m4a", ".ogg", ".wav", ".flac", ".webm"}
+
+# audio codecs that can be copied out of a video file as is, with the extension of their container
+DEMUX_EXTENSIONS = {
+    "aac": ".m4a",
+    "alac": ".m4a",
+    "mp3": ".mp3",
+    "opus": ".ogg",
+    "vorbis": ".ogg",
+    "flac": ".flac",
+    "pcm_s16le": ".wav",
+}
+
+# ffmpeg raw formats of the samples, by sample width
+PCM_FORMATS = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+
+# compact speech formats for the upload to the transcription API: extension and ffmpeg encoding arguments
+UPLOAD_FORMATS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "24k", "-application", "voip"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-b:a", "32k"]),
+}
+
+
+def run_ffmpeg(*arguments):
+    command = [AudioSegment.converter, "-y", "-loglevel", "error", *arguments]
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode:
+        raise RuntimeError(f"ffmpeg failed: {process.stderr.decode(errors='replace')}")
+    return process.stdout
+
+
+def audio_stream_info(path):
+    """Return the ffprobe information of the first audio stream of the file."""
+    info = mediainfo_json(path)
+    streams = [stream for stream in info.get("streams", []) if stream.get("codec_type") == "audio"]
+    if not streams:
+        raise ValueError(f"{path} has no audio stream.")
+    stream = streams[0]
+    if "duration" not in stream:
+        stream["duration"] = info.get("format", {}).get("duration", 0)
+    return stream
+
+
+def media_type(path):
+    """Return "video" or "audio" according to the streams ffprobe finds in the file, whatever its extension,
+    or None if it has neither. The cover art of the audio files isn't taken for a video stream."""
+    streams = [
+        stream for stream in mediainfo_json(path).get("streams", []) if not stream.get("disposition", {}).get("attached_pic")
+    ]
+    codec_types = {stream.get("codec_type") for stream in streams}
+    if "video" in codec_types:
+        return "video"
+    if "audio" in codec_types:
+        return "audio"
+    return None
+
+
+def cut_audio(path, output_path, start=0, end=None, copy=False, arguments=()):
+    """Write the `[start, end]` window (in seconds) of the audio file to `output_path`.
+
+    The input is seeked directly, so only the window is decoded. With `copy`, the audio stream is copied as is,
+    which is much faster and lossless, but the cut is only accurate to the audio frames of the source."""
+    command = ["-ss", f"{start:.3f}", "-i", path]
+    if end is not None:
+        command += ["-t", f"{end - start:.3f}"]
+    command += ["-vn", "-map_metadata", "-1"]
+    if copy:
+        command += ["-c:a", "copy"]
+    run_ffmpeg(*command, *arguments, output_path)
+    return output_path
+
+
+def extract_audio(path, output_dir, name="audio"):
+    """Extract the audio stream of a video file to `output_dir` with ffmpeg, without touching the video stream.
+
+    The audio stream is copied as is into a container of its codec when there is one, which only takes the time
+    to read the file; otherwise, or if the copy fails, it's re-encoded to MP3. Return the path of the audio file."""
+    codec = audio_stream_info(path).get("codec_name")
+    extension = DEMUX_EXTENSIONS.get(codec)
+    if extension is not None:
+        output_path = os.path.join(output_dir, f"{name}{extension}")
+        try:
+            run_ffmpeg("-i", path, "-map", "0:a:0", "-vn", "-c:a", "copy", output_path)
+            return output_path
+        except RuntimeError:
+            logger.info(f"\nCan't copy the {codec} audio stream, re-encoding it.")
+    output_path = os.path.join(output_dir, f"{name}.mp3")
+    run_ffmpeg("-i", path, "-map", "0:a:0", "-vn", "-c:a", "libmp3lame", "-q:a", "2", output_path)
+    return output_path
+
+
+def transcode_for_upload(path, output_dir, upload_format="opus", start=0, end=None, name=None):
+    """Encode the `[start, end]` window (in seconds) of the audio file to a compact 16 kHz mono speech format.
+
+    The timeline is kept as is, so the timestamps of the transcription still index the original audio.
+    Return the path of the encoded file, named after `name` or the source file in `output_dir`."""
+    extension, arguments = UPLOAD_FORMATS[upload_format]
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    output_path = os.path.join(output_dir, f"{name}{extension}")
+    return cut_audio(path, output_path, start, end, arguments=["-ar", "16000", "-ac", "1", *arguments])
+
+
+class AudioFile:
+    """Audio file sliced by seeking with ffmpeg, so that only the used windows are ever decoded.
+
+    Slicing it in milliseconds like an `AudioSegment` returns a new lazy view of the file, which is decoded into an
+    `AudioSegment` by `decode()`. The views are cheap to pickle, so they can be decoded by worker processes."""
+
+    sample_width = 2
+
+    def __init__(self, path, start=0, end=None, stream_info=None):
+        self.path = path
+        self.stream_info = stream_info or audio_stream_info(path)
+        self.frame_rate = int(self.stream_info["sample_rate"])
+        self.channels = int(self.stream_info["channels"])
+        self.start = start
+        self.end = int(float(self.stream_info["duration"]) * 1000) if end is None else end
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def duration_seconds(self):
+        return len(self) / 1000
+
+    def __getitem__(self, millisecond):
+        if not isinstance(millisecond, slice) or millisecond.step is not None:
+            raise TypeError("AudioFile only supports slicing in milliseconds.")
+        start, end, _ = millisecond.indices(len(self))
+        return AudioFile(self.path, self.start + start, self.start + max(start, end), self.stream_info)
+
+    def decode(self):
+        data = run_ffmpeg(
+            "-ss",
+            f"{self.start / 1000:.3f}",
+            "-i",
+            self.path,
+            "-t",
+            f"{len(self) / 1000:.3f}",
+            "-vn",
+            "-f",
+            "s16le",
+            "-ar",
+            str(self.frame_rate),
+            "-ac",
+            str(self.channels),
+            "pipe:1",
+        )
+        return AudioSegment(data=data, sample_width=self.sample_width, frame_rate=self.frame_rate, channels=self.channels)
+
+    @property
+    def raw_data(self):
+        return self.decode().raw_data
+
+    @property
+    def dBFS(self):
+        return self.decode().dBFS
+
+    def export(self, *args, **kwargs):
+        return self.decode().export(*args, **kwargs)
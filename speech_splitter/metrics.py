@@ -0,0 +1,101 @@
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# metrics of the file being processed in the current thread, if any
+current_metrics = contextvars.ContextVar("current_metrics", default=None)
+
+
+def _peak_rss():
+    """Peak resident set size of the process so far, in bytes, or None when unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _children_cpu_time():
+    # CPU time of the finished subprocesses, e.g. ffmpeg
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Metrics:
+    """Wall time, CPU time, peak RSS, bytes uploaded and bytes written of every stage of the processing of a file.
+
+    The CPU times and the peak RSS are measured for the whole process, so they also include the other files
+    processed at the same time. `hook` is called with the name of the file and the record of every finished stage."""
+
+    def __init__(self, name, hook=None):
+        self.name = name
+        self.hook = hook
+        self.stages = []
+        self._lock = threading.Lock()
+        self._current = None
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the stage run in the `with` block, making the metrics current for `record()`."""
+        record = {"stage": name, "bytes_uploaded": 0, "bytes_written": 0}
+        previous, self._current = self._current, record
+        token = current_metrics.set(self)
+        wall_time, cpu_time, children_cpu_time = time.perf_counter(), time.process_time(), _children_cpu_time()
+        try:
+            yield record
+        finally:
+            record["wall_time"] = time.perf_counter() - wall_time
+            record["cpu_time"] = time.process_time() - cpu_time
+            record["children_cpu_time"] = _children_cpu_time() - children_cpu_time
+            record["peak_rss"] = _peak_rss()
+            current_metrics.reset(token)
+            self._current = previous
+            self.stages.append(record)
+            logger.debug(f"\n{self.name}: {name} took {record['wall_time']:.2f}s")
+            if self.hook is not None:
+                self.hook(self.name, record)
+
+    def add(self, key, amount):
+        with self._lock:
+            if self._current is not None:
+                self._current[key] += amount
+
+    def as_dict(self):
+        totals = {
+            key: sum(stage[key] for stage in self.stages)
+            for key in ("wall_time", "cpu_time", "children_cpu_time", "bytes_uploaded", "bytes_written")
+        }
+        peaks = [stage["peak_rss"] for stage in self.stages if stage["peak_rss"] is not None]
+        totals["peak_rss"] = max(peaks) if peaks else None
+        return {"input": self.name, "stages": self.stages, "total": totals}
+
+
+def record(key, amount):
+    """Add the amount (e.g. of "bytes_uploaded" or "bytes_written") to the current stage, if it's measured."""
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.add(key, amount)
+
+
+def write_metrics(metrics, path):
+    """Write the metrics of the processed files as JSON, to the standard output for "-"."""
+    report = [item.as_dict() for item in metrics]
+    if path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
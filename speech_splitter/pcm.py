@@ -0,0 +1,123 @@
+import logging
+import math
+import os
+import tempfile
+
+import numpy as np
+from pydub import AudioSegment
+
+from .cache import DiskCache, file_hash
+from .media import audio_stream_info, run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+
+class PcmAudio:
+    """Decoded audio, read from a raw 16-bit PCM file through `numpy.memmap`.
+
+    Slicing it in milliseconds like an `AudioSegment` returns a zero-copy view sharing the same memory map, so
+    every view is served from the OS page cache, which is shared between the processes reading the same file."""
+
+    sample_width = 2
+
+    def __init__(self, path, frame_rate, channels, start=0, end=None, samples=None):
+        self.path = path
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self._samples = self._map() if samples is None else samples
+        self.start = start
+        self.end = len(self._samples) if end is None else end
+
+    def _map(self):
+        if not os.path.getsize(self.path):
+            return np.zeros((0, self.channels), dtype="<i2")
+        return np.memmap(self.path, dtype="<i2", mode="r").reshape(-1, self.channels)
+
+    def __getstate__(self):
+        # the memory map is opened again when unpickled, e.g. by a worker process
+        state = self.__dict__.copy()
+        del state["_samples"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._samples = self._map()
+
+    def __len__(self):
+        return (self.end - self.start) * 1000 // self.frame_rate
+
+    @property
+    def duration_seconds(self):
+        return (self.end - self.start) / self.frame_rate
+
+    def __getitem__(self, millisecond):
+        if not isinstance(millisecond, slice) or millisecond.step is not None:
+            raise TypeError("PcmAudio only supports slicing in milliseconds.")
+        start, end, _ = millisecond.indices(len(self))
+        start = self.start + start * self.frame_rate // 1000
+        end = min(self.start + end * self.frame_rate // 1000, self.end)
+        return PcmAudio(self.path, self.frame_rate, self.channels, start, max(start, end), self._samples)
+
+    @property
+    def array(self):
+        """The samples of the view, as a `(frames, channels)` array backed by the memory map."""
+        return self._samples[self.start : self.end]
+
+    @property
+    def raw_data(self):
+        return memoryview(self.array).cast("B")
+
+    @property
+    def dBFS(self):
+        if not self.end > self.start:
+            return -float("inf")
+        rms = math.sqrt(np.mean(np.square(self.array, dtype=np.float64)))
+        if not rms:
+            return -float("inf")
+        return 20 * math.log10(rms / 2**15)
+
+    def decode(self):
+        return AudioSegment(
+            data=bytes(self.raw_data), sample_width=self.sample_width, frame_rate=self.frame_rate, channels=self.channels
+        )
+
+    def export(self, *args, **kwargs):
+        return self.decode().export(*args, **kwargs)
+
+
+class PcmCache(DiskCache):
+    """Cache of the audio files decoded to raw PCM, keyed by the hash of the file content and the sample format,
+    so that a file is decoded only once, whatever the number of times and processes it's used by."""
+
+    suffix = ".pcm"
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        super().__init__("pcm", cache_dir, max_size)
+
+    def load(self, audio_path, frame_rate=None, channels=None):
+        """Return the decoded audio of the file as `PcmAudio`, decoding it only if it's not cached yet."""
+        if frame_rate is None or channels is None:
+            stream_info = audio_stream_info(audio_path)
+            frame_rate = frame_rate or int(stream_info["sample_rate"])
+            channels = channels or int(stream_info["channels"])
+        path = self._path(f"{file_hash(audio_path)}_{frame_rate}_{channels}_s16le")
+        if os.path.exists(path):
+            self.touch(path)
+            logger.info("\nUsing the cached decoded audio.")
+        else:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # decode to a temporary file first so that concurrent readers never see a partial entry
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as file:
+                pass
+            try:
+                run_ffmpeg("-i", audio_path, "-vn", "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels), file.name)
+                os.replace(file.name, path)
+            finally:
+                if os.path.exists(file.name):
+                    os.unlink(file.name)
+        # map the file before evicting the old entries, the mapping stays valid even if the file is removed
+        audio = PcmAudio(path, frame_rate, channels)
+        self.evict()
+        return audio
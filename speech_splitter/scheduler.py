@@ -0,0 +1,94 @@
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+from .media import audio_stream_info
+
+logger = logging.getLogger(__name__)
+
+# concurrent decodings, transcriptions and encodings
+DEFAULT_LIMITS = {"decoding": 2, "transcription": 4, "encoding": 2}
+DEFAULT_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024
+
+
+class InputTooLarge(ValueError):
+    """The input needs more memory than the whole budget, so it can never be admitted."""
+
+
+def estimate_memory(path, sample_width=2):
+    """Estimate the memory (in bytes) of the audio file decoded to PCM, from its duration and sample format."""
+    stream_info = audio_stream_info(path)
+    frames = float(stream_info.get("duration") or 0) * int(stream_info["sample_rate"])
+    return int(frames * int(stream_info["channels"]) * sample_width)
+
+
+class Resource:
+    """Semaphore of the given capacity, admitting the waiting requests in their order of arrival, so that
+    a big request isn't overtaken forever by the smaller ones."""
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.used = 0
+        self._line = []
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self, amount=1, waiting=None):
+        """Hold `amount` of the resource in the `with` block, once it's available and the requests that arrived
+        earlier are served; `waiting` is called with the position (from 1) in the line while it waits."""
+        if amount > self.capacity:
+            raise InputTooLarge(f"Needs {amount} of {self.name}, more than the limit of {self.capacity}.")
+        ticket = object()
+        with self._condition:
+            self._line.append(ticket)
+            try:
+                while self._line[0] is not ticket or self.used + amount > self.capacity:
+                    if waiting is not None:
+                        waiting(self._line.index(ticket) + 1)
+                    self._condition.wait()
+            finally:
+                self._line.remove(ticket)
+                # the next request in the line may fit too
+                self._condition.notify_all()
+            self.used += amount
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.used -= amount
+                self._condition.notify_all()
+
+    @property
+    def waiting(self):
+        return len(self._line)
+
+
+class Scheduler:
+    """Admission control of the processing, shared by the whole process: the number of concurrent decodings,
+    transcriptions and encodings are limited, as well as the memory of the decoded audio being processed.
+
+    The stages without a limit (None) aren't limited."""
+
+    def __init__(self, limits=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.resources = {stage: Resource(stage, limit) for stage, limit in limits.items() if limit is not None}
+        self.memory = Resource("memory", memory_budget)
+
+    def slot(self, stage, waiting=None):
+        """Context manager holding a slot of the stage."""
+        if stage not in self.resources:
+            return nullcontext()
+        return self.resources[stage].acquire(waiting=waiting)
+
+    def reserve(self, path, waiting=None):
+        """Context manager reserving the estimated memory of the decoded audio file, raising `InputTooLarge`
+        right away if it exceeds the whole budget."""
+        memory = estimate_memory(path)
+        logger.debug(f"\nEstimated memory of {path}: {memory / 1024 / 1024:.0f} MB")
+        if memory > self.memory.capacity:
+            raise InputTooLarge(
+                f"The file is too long: decoding it needs {memory / 1024 / 1024:.0f} MB, "
+                f"more than the memory budget of {self.memory.capacity / 1024 / 1024:.0f} MB."
+            )
+        return self.memory.acquire(memory, waiting=waiting)
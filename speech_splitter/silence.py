@@ -0,0 +1,93 @@
+import bisect
+import subprocess
+import tempfile
+
+import numpy as np
+from pydub import AudioSegment
+
+from .energy import audio_samples
+from .media import PCM_FORMATS, AudioFile
+from .pcm import PcmCache
+
+
+def find_speech_regions(audio, min_silence=1.0, padding=0.25, threshold=16, frame=0.01, block_frames=6000):
+    """Return the `(start, end)` regions (in ms) of the audio left once the silences longer than `min_silence`
+    seconds are removed, keeping `padding` seconds of silence around the speech.
+
+    A `frame` seconds frame is silent when its level is more than `threshold` dB below the average level of the
+    audio. The frame energies are computed with NumPy by blocks of `block_frames` frames, to bound the memory use."""
+    samples = audio_samples(audio)
+    frame_length = max(int(frame * audio.frame_rate), 1)
+    count = len(samples) // frame_length
+    energy = np.empty(count)
+    for first in range(0, count, block_frames):
+        last = min(first + block_frames, count)
+        block = samples[first * frame_length : last * frame_length].astype(np.float64).mean(axis=1)
+        energy[first:last] = np.square(block).reshape(last - first, frame_length).mean(axis=1)
+    if not count:
+        return [(0, len(audio))]
+    silent = np.concatenate([[False], energy < energy.mean() * 10 ** (-threshold / 10), [False]])
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    frame_ms = frame_length * 1000 / audio.frame_rate
+    regions, position = [], 0
+    for start, end in zip(edges[::2], edges[1::2]):
+        if (end - start) * frame_ms < min_silence * 1000:
+            continue
+        cut_start, cut_end = int(start * frame_ms + padding * 1000), int(end * frame_ms - padding * 1000)
+        if cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            regions.append((position, cut_start))
+        position = cut_end
+    if len(audio) > position:
+        regions.append((position, len(audio)))
+    return regions
+
+
+def trim_silences(audio, regions, output_path, arguments=()):
+    """Write the regions (in ms) of the audio back to back to `output_path`, encoded by ffmpeg with `arguments`.
+
+    Return the offset map, i.e. the `(trimmed_start, original_start)` times (in seconds) of every region."""
+    if isinstance(audio, AudioFile):
+        # read the regions from the memory-mapped decoded file rather than decoding them one by one
+        audio = PcmCache().load(audio.path, audio.frame_rate, audio.channels)[audio.start : audio.end]
+    command = [AudioSegment.converter, "-y", "-loglevel", "error", "-f", PCM_FORMATS[audio.sample_width]]
+    command += ["-ar", str(audio.frame_rate), "-ac", str(audio.channels), "-i", "pipe:0", *arguments, output_path]
+    offset_map, position = [], 0.0
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            for start, end in regions:
+                clip = audio[start:end]
+                offset_map.append((position, start / 1000))
+                position += clip.duration_seconds
+                process.stdin.write(clip.raw_data)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+            process.wait()
+        if process.returncode:
+            stderr.seek(0)
+            raise RuntimeError(f"ffmpeg failed: {stderr.read().decode(errors='replace')}")
+    return offset_map
+
+
+def remap_words(words, offset_map):
+    """Shift the timestamps of the words transcribed from the trimmed audio back to the original audio."""
+    trimmed_starts = [trimmed_start for trimmed_start, _ in offset_map]
+
+    def remap(time, index):
+        trimmed_start, original_start = offset_map[max(index - 1, 0)]
+        return original_start + time - trimmed_start
+
+    return [
+        word.model_copy(
+            update={
+                "start": remap(word.start, bisect.bisect_right(trimmed_starts, word.start)),
+                # a word ending exactly at the start of a region ends with the previous one
+                "end": remap(word.end, bisect.bisect_left(trimmed_starts, word.end)),
+            }
+        )
+        for word in words
+    ]
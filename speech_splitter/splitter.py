@@ -1,98 +1,458 @@
 import argparse
+import contextvars
 import base64
+import io
 from math import floor
 import mimetypes
 import os
+import shutil
 import string
+import struct
+import subprocess
 import sys
 import tempfile
+import threading
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from importlib.metadata import version
+from itertools import repeat
 import json
+from urllib.parse import quote
+
+from functools import lru_cache
 
-import moviepy.editor as mp
 from pydub import AudioSegment
 from pydub.utils import mediainfo
-from openai import OpenAI
-import nltk
-from nltk import tokenize
 from progress.spinner import Spinner
 
-# require environment variables
-if "OPENAI_API_KEY" not in os.environ:
-    raise ValueError("OpenAI API key is not set. Please set the OPENAI_API_KEY environment variable.")
-client = OpenAI()
+from .cache import TranscriptionCache
+from .media import (
+    MAX_UPLOAD_SIZE,
+    PCM_FORMATS,
+    STREAM_COPY_EXTENSIONS,
+    UPLOAD_FORMATS,
+    AudioFile,
+    cut_audio,
+    extract_audio,
+    transcode_for_upload,
+)
+from .backends import BACKENDS, OpenAIBackend, create_backend
+from .metrics import Metrics, record, write_metrics
+from .transport import configure_transport
+
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 
 
-def transcribe_audio(audio_path):
-    with open(audio_path, "rb") as audio_file:
-        logger.info("\nTranscribing audio...")
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            timestamp_granularities=["word"],
-            response_format="verbose_json",
-            # language="nl",
+def ensure_tokenizer_data(package="punkt_tab"):
+    """Download the nltk tokenizer data, only if it's not installed yet."""
+    import nltk
+
+    try:
+        nltk.data.find(f"tokenizers/{package}")
+    except LookupError:
+        nltk.download(package, quiet=True)
+
+
+def find_split_points(audio, chunk_length, search_window=30, step=50):
+    """Return split points (ms) close to every `chunk_length` seconds, placed at the quietest
+    `step` ms slice within the `search_window` seconds before each target."""
+    split_points = []
+    chunk_ms = int(chunk_length * 1000)
+    search_ms = int(min(search_window, chunk_length / 2) * 1000)
+    previous = 0
+    while len(audio) - previous > chunk_ms:
+        target = previous + chunk_ms
+        quietest, split_point = None, target
+        window = audio[target - search_ms : target]
+        if isinstance(window, AudioFile):
+            window = window.decode()
+        for position in range(0, len(window), step):
+            loudness = window[position : position + step].dBFS
+            if quietest is None or loudness < quietest:
+                quietest, split_point = loudness, target - search_ms + position + step // 2
+        split_points.append(split_point)
+        previous = split_point
+    return split_points
+
+
+def _find_word_positions(text, words):
+    # character offset of each word in the text, or None when the word can't be located
+    positions = []
+    cursor = 0
+    lowered = text.lower()
+    for word in words:
+        position = lowered.find(word.word.strip().lower(), cursor)
+        if position < 0:
+            positions.append(None)
+            continue
+        positions.append(position)
+        cursor = position + len(word.word.strip())
+    return positions
+
+
+def merge_chunk_transcripts(chunks):
+    """Merge the transcripts of overlapping chunks into a single global timeline.
+
+    `chunks` is a list of `(offset, keep_start, keep_end, (language, text, words))` tuples, all in seconds.
+    The chunk words are shifted by `offset`, and only the words with the middle inside
+    `[keep_start, keep_end)` are kept, which removes the duplicates from the overlaps."""
+    language = None
+    texts = []
+    merged = []
+    for offset, keep_start, keep_end, (chunk_language, text, words) in chunks:
+        language = language or chunk_language
+        kept = [index for index, word in enumerate(words) if keep_start <= offset + (word.start + word.end) / 2 < keep_end]
+        for index in kept:
+            word = words[index]
+            if merged and merged[-1].word == word.word and offset + word.start < merged[-1].end:
+                # same word transcribed in both chunks of the overlap
+                continue
+            merged.append(word.model_copy(update={"start": offset + word.start, "end": offset + word.end}))
+        if not kept:
+            continue
+        # cut the text of the chunk to the kept words, keeping the punctuation around them
+        positions = _find_word_positions(text, words)
+        first, last = positions[kept[0]], None
+        following = [position for position in positions[kept[-1] + 1 :] if position is not None]
+        if following:
+            last = following[0]
+        if first is None:
+            texts.append(" ".join(words[index].word for index in kept))
+        else:
+            texts.append(text[first:last].strip())
+    return language, " ".join(texts), merged
+
+
+def _log_upload_savings(audio_path, upload_paths):
+    original_size = os.path.getsize(audio_path)
+    upload_size = sum(os.path.getsize(path) for path in upload_paths)
+    logger.info(
+        f"\nUploading {upload_size / 1e6:.1f} MB instead of {original_size / 1e6:.1f} MB "
+        f"({1 - upload_size / max(original_size, 1):.0%} less) for {os.path.basename(audio_path)}."
+    )
+
+
+def _transcribe_trimmed(audio_path, audio, chunk_length, overlap, max_workers, upload_format, backend):
+    """Transcribe the audio without its long silences, then shift the word timestamps back to the original audio."""
+    from .silence import find_speech_regions, remap_words, trim_silences
+
+    if audio is None:
+        audio = AudioFile(audio_path)
+    regions = find_speech_regions(audio)
+    removed = audio.duration_seconds - sum(end - start for start, end in regions) / 1000
+    if removed <= 0:
+        return transcribe_audio(
+            audio_path, audio, chunk_length, overlap, max_workers, upload_format=upload_format, backend=backend
         )
+    logger.info(f"\nRemoving {removed:.1f}s of silence ({removed / audio.duration_seconds:.0%}) before the transcription.")
+    # the trimmed audio has to be encoded anyway, so it's encoded to the compact upload format
+    extension, arguments = UPLOAD_FORMATS[upload_format or "opus"]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        trimmed_path = os.path.join(temp_dir, f"trimmed{extension}")
+        offset_map = trim_silences(audio, regions, trimmed_path, ["-ar", "16000", "-ac", "1", *arguments])
+        _log_upload_savings(audio_path, [trimmed_path])
+        language, text, words = transcribe_audio(trimmed_path, None, chunk_length, overlap, max_workers, backend=backend)
+    return language, text, remap_words(words, offset_map)
+
+
+def _max_chunk_length(audio_path, duration, overlap):
+    # longest chunk (in seconds) uploaded as is that fits, with a margin, in the upload limit of the API
+    if os.path.splitext(audio_path)[1].lower() in STREAM_COPY_EXTENSIONS:
+        # copied, at the average bitrate of the file
+        bytes_per_second = os.path.getsize(audio_path) / duration
+    else:
+        # re-encoded to MP3, at the default 128 kbps of ffmpeg
+        bytes_per_second = 128000 / 8
+    return max(0.9 * MAX_UPLOAD_SIZE / bytes_per_second - 2 * overlap, 1)
+
+
+def transcribe_audio(
+    audio_path,
+    audio=None,
+    chunk_length=600,
+    overlap=2,
+    max_workers=4,
+    cache=None,
+    upload_format=None,
+    trim_silence=False,
+    backend=None,
+):
+    """Transcribe the audio with the `TranscriptionBackend` (the OpenAI API by default), returning the
+    `(language, text, words)` tuple.
+
+    Recordings longer than `chunk_length` seconds are split at quiet points into windows overlapping by
+    `overlap` seconds, which are transcribed concurrently by up to `max_workers` requests. Without an
+    `upload_format`, the files too big for the API are split too, into windows short enough to be uploaded as is.
+    With an `upload_format` ("opus" or "mp3"), the audio is re-encoded to a compact 16 kHz mono format before
+    being uploaded; the timeline is unchanged, so the word timestamps still index the original audio.
+    With `trim_silence`, the silences longer than a second are removed before the upload, and the word
+    timestamps are mapped back to the original audio.
+    When a `TranscriptionCache` is given, the transcription of an already processed audio is reused."""
+    if backend is None:
+        backend = OpenAIBackend()
+    if cache is not None:
+        options = {"upload_format": upload_format} if upload_format else {}
+        if trim_silence:
+            options["trim_silence"] = True
+        key = cache.key(audio_path, model=backend.name, chunk_length=chunk_length, overlap=overlap, **options)
+        result = cache.get(key)
+        if result is None:
+            result = transcribe_audio(
+                audio_path,
+                audio,
+                chunk_length,
+                overlap,
+                max_workers,
+                upload_format=upload_format,
+                trim_silence=trim_silence,
+                backend=backend,
+            )
+            cache.set(key, *result)
+        return result
+
+    if trim_silence:
+        return _transcribe_trimmed(audio_path, audio, chunk_length, overlap, max_workers, upload_format, backend)
+
+    logger.info("\nTranscribing audio...")
+    duration = float(mediainfo(audio_path).get("duration", 0)) if audio is None else audio.duration_seconds
+    max_length = chunk_length or float("inf")
+    if upload_format is None and duration and os.path.getsize(audio_path) > MAX_UPLOAD_SIZE:
+        # e.g. a few minutes of uncompressed audio
+        max_length = min(max_length, _max_chunk_length(audio_path, duration, overlap))
+    if duration <= max_length:
+        if upload_format is None:
+            result = backend.transcribe(audio_path)
+        else:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                upload_path = transcode_for_upload(audio_path, temp_dir, upload_format)
+                _log_upload_savings(audio_path, [upload_path])
+                result = backend.transcribe(upload_path)
         logger.info("\nTranscription complete!")
-        return transcript.language, transcript.text, transcript.words
+        return result
+
+    if audio is None:
+        audio = AudioFile(audio_path)
+    bounds = [0] + find_split_points(audio, max_length) + [len(audio)]
+    overlap_ms = int(overlap * 1000)
+    # cut the chunks straight from the file, copying the audio stream when the API accepts its format
+    extension = os.path.splitext(audio_path)[1].lower()
+    copy = extension in STREAM_COPY_EXTENSIONS
+    with tempfile.TemporaryDirectory() as temp_dir:
+        windows = []
+        for index, (keep_start, keep_end) in enumerate(zip(bounds, bounds[1:])):
+            start = max(keep_start - overlap_ms, 0)
+            end = min(keep_end + overlap_ms, len(audio))
+            if upload_format is None:
+                chunk_path = os.path.join(temp_dir, f"chunk_{index}{extension if copy else '.mp3'}")
+                cut_audio(audio_path, chunk_path, start / 1000, end / 1000, copy=copy)
+            else:
+                chunk_path = transcode_for_upload(
+                    audio_path, temp_dir, upload_format, start / 1000, end / 1000, name=f"chunk_{index}"
+                )
+            windows.append((start / 1000, keep_start / 1000, keep_end / 1000, chunk_path))
+        if upload_format is not None:
+            _log_upload_savings(audio_path, [window[-1] for window in windows])
+        logger.info(f"\nTranscribing {len(windows)} chunks...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # run the requests in the context of the caller, so that they're recorded in its metrics
+            futures = [
+                executor.submit(contextvars.copy_context().run, backend.transcribe, chunk_path, offset)
+                for offset, _, _, chunk_path in windows
+            ]
+            results = [future.result() for future in futures]
+    # the last chunk keeps everything until the end of the recording
+    chunks = [(offset, keep_start, keep_end, result) for (offset, keep_start, keep_end, _), result in zip(windows, results)]
+    chunks[-1] = chunks[-1][:2] + (float("inf"),) + chunks[-1][3:]
+    result = merge_chunk_transcripts(chunks)
+    logger.info("\nTranscription complete!")
+    return result
 
 
 # Split the given text into sentences
 def split_text_into_sentences(text, language):
+    import nltk
+
     return nltk.sent_tokenize(text, language=language)
 
 
-wordTokenizer = tokenize.TweetTokenizer()
+@lru_cache(maxsize=None)
+def _word_tokenizer():
+    from nltk.tokenize import TweetTokenizer
+
+    return TweetTokenizer()
 
 
 # Split the given text into words
 def split_text_into_words(text, language):
-    res = [x for x in wordTokenizer.tokenize(text) if x not in string.punctuation and x[0] not in string.punctuation]
+    res = [x for x in _word_tokenizer().tokenize(text) if x not in string.punctuation and x[0] not in string.punctuation]
     return res
 
 
-def get_boundary_words(sentence_index, word_index, sentence, words, language):
-    sentence_words = split_text_into_words(sentence, language)
-    start_word = words[word_index]
-    end_word = start_word
-    # print(words)
-    for i, sentence_word in enumerate(sentence_words):
-        audio_word = words[word_index]
-        # if the word is not the same as the sentence word, then most likely it has a punctuation and OpenAI falsely separated
-        # it, so correct the word index
-        if audio_word.word.lower() != sentence_word.lower():
-            while not sentence_word.lower().endswith(audio_word.word.lower()):
-                logger.warning(
-                    f"Correcting word in sentence {sentence_index+1}: "
-                    f"{audio_word.word} to {sentence_word} (word index: {word_index+1})"
-                )
-                word_index += 1
-                if word_index > len(words) - 1:
-                    break
-                audio_word = words[word_index]
-        if i == len(sentence_words) - 1:
-            # last word in the sentence
-            end_word = audio_word
-        word_index += 1
-        if word_index > len(words) - 1:
-            word_index = len(words) - 1
-    return start_word, end_word, word_index
-
-
-def get_sentences_as_audio(sentences, original_audio, words, language):
-    word_index = 0
-    result = []
+def _normalize_word(word):
+    return "".join(char for char in word.lower() if char.isalnum())
+
+
+def _match_tokens(tokens, audio_words, i, j, max_pieces=3):
+    """Match the sentence token(s) at `i` with the transcript word(s) at `j`.
+
+    Return the number of tokens and words consumed, or None. Whisper and the tokenizer don't always split
+    the words the same way (e.g. "can't" vs "can" + "'t"), so up to `max_pieces` pieces are joined on either side."""
+    if tokens[i] == audio_words[j]:
+        return 1, 1
+    joined = audio_words[j]
+    for pieces in range(2, max_pieces + 1):
+        if j + pieces > len(audio_words) or not tokens[i].startswith(joined):
+            break
+        joined += audio_words[j + pieces - 1]
+        if joined == tokens[i]:
+            return 1, pieces
+    joined = tokens[i]
+    for pieces in range(2, max_pieces + 1):
+        if i + pieces > len(tokens) or not audio_words[j].startswith(joined):
+            break
+        joined += tokens[i + pieces - 1]
+        if joined == audio_words[j]:
+            return pieces, 1
+    return None
+
+
+def _run_length(tokens, audio_words, i, j, limit):
+    # number of tokens matching the transcript in a row from `i` and `j`, up to `limit`; reaching the end counts as a full run
+    length = 0
+    while length < limit:
+        if i >= len(tokens) or j >= len(audio_words):
+            return limit
+        match = _match_tokens(tokens, audio_words, i, j)
+        if match is None:
+            break
+        i, j, length = i + match[0], j + match[1], length + 1
+    return length
+
+
+def _find_anchor(tokens, audio_words, i, j, band, max_band=256):
+    """Find where the tokens at `i` and the transcript words at `j` match again, as the `(skip_tokens, skip_words)`
+    to skip on either side, or None.
+
+    The nearest position within `band` confirmed by `band` matching tokens in a row is taken. Failing that, the search
+    is widened up to `max_band` (e.g. a whole sentence missing from the transcript), and then the local position
+    followed by the longest run, of at least two tokens, is taken."""
+    best, best_length = None, 1
+    for distance in range(1, max_band + 1):
+        for skip_tokens, skip_words in ((0, distance), (distance, 0), (distance, distance)):
+            ti, wj = i + skip_tokens, j + skip_words
+            if ti >= len(tokens) or wj >= len(audio_words) or tokens[ti] != audio_words[wj]:
+                continue
+            length = _run_length(tokens, audio_words, ti, wj, band)
+            if length == band:
+                return skip_tokens, skip_words
+            if distance <= band and length > best_length:
+                best, best_length = (skip_tokens, skip_words), length
+        if distance >= band and best is not None:
+            break
+        if i + distance >= len(tokens) and j + distance >= len(audio_words):
+            break
+    return best
+
+
+def _skip_whole_sentence(tokens, token_sentences, token_spans, i, skip_tokens):
+    # skipping the tokens at `i` is equivalent to skipping the same tokens earlier, already matched, e.g. in a drill
+    # repeating the same words; prefer skipping a whole sentence, missing from the transcript, when there is one
+    shift = 0
+    while shift < i and tokens[i - 1 - shift] == tokens[i + skip_tokens - 1 - shift] and token_spans[i - 1 - shift]:
+        shift += 1
+        start = i - shift
+        if start == 0 or token_sentences[start] != token_sentences[start - 1]:
+            for offset in range(shift):
+                token_spans[i + skip_tokens - 1 - offset] = token_spans[i - 1 - offset]
+                token_spans[i - 1 - offset] = None
+            return
+
+
+def align_sentences(sentences, words, language, band=8):
+    """Align the sentences with the transcript words in a single pass.
+
+    Return a `(start_index, end_index)` span of `words` for every sentence. The sentence tokens are matched
+    against the transcript words left to right; on a mismatch, the alignment is resynchronized on the nearest
+    position within `band` where they match again for `band` words in a row, or farther if there is none,
+    so a mismatch never cascades into the following sentences."""
+    if not words:
+        raise ValueError("The transcription has no words to align the sentences with.")
+    tokens, token_sentences = [], []
     for index, sentence in enumerate(sentences):
-        start_word, end_word, word_index = get_boundary_words(index, word_index, sentence, words, language)
-        start_time = start_word.start
-        # add time buffer before the start
-        start_time = start_time - 0.3
-        if start_time < 0:
-            start_time = 0
-        end_time = end_word.end + 0.3
+        for token in split_text_into_words(sentence, language):
+            token = _normalize_word(token)
+            if token:
+                tokens.append(token)
+                token_sentences.append(index)
+    audio_words = [_normalize_word(word.word) for word in words]
+
+    token_spans = [None] * len(tokens)
+    unmatched = 0
+    i = j = 0
+    while i < len(tokens) and j < len(audio_words):
+        match = _match_tokens(tokens, audio_words, i, j)
+        if match is None:
+            anchor = _find_anchor(tokens, audio_words, i, j, band)
+            if anchor is not None:
+                skip_tokens, skip_words = anchor
+                if skip_tokens == skip_words:
+                    # as many words transcribed differently as tokens skipped, pair them up
+                    for offset in range(skip_tokens):
+                        token_spans[i + offset] = (j + offset, j + offset)
+                else:
+                    unmatched += skip_tokens
+                    if skip_tokens:
+                        _skip_whole_sentence(tokens, token_sentences, token_spans, i, skip_tokens)
+                i, j = i + skip_tokens, j + skip_words
+                continue
+            # no anchor nearby: most likely the same word transcribed differently
+            match = 1, 1
+        consumed_tokens, consumed_words = match
+        for token_index in range(i, i + consumed_tokens):
+            token_spans[token_index] = (j, j + consumed_words - 1)
+        i, j = i + consumed_tokens, j + consumed_words
+    unmatched += len(tokens) - i
+    if unmatched:
+        logger.warning(f"\n{unmatched} of {len(tokens)} words could not be aligned with the transcription.")
+
+    sentence_spans = [None] * len(sentences)
+    for token_span, index in zip(token_spans, token_sentences):
+        if token_span is None:
+            continue
+        if sentence_spans[index] is None:
+            sentence_spans[index] = token_span
+        else:
+            sentence_spans[index] = (sentence_spans[index][0], token_span[1])
+    # sentences without any aligned word get the word following the previous sentence
+    previous_end = -1
+    for index, span in enumerate(sentence_spans):
+        if span is None:
+            position = min(previous_end + 1, len(words) - 1)
+            span = sentence_spans[index] = (position, position)
+        previous_end = span[1]
+    return sentence_spans
+
+
+def get_sentences_as_audio(sentences, original_audio, words, language, refine_radius=0):
+    """Cut the audio of every sentence, from its first word to its last word with a margin of 0.3s.
+
+    With a `refine_radius` (in seconds), the boundaries are then snapped to the nearest low-energy valley
+    within that radius, so that the clips neither cut the first consonant nor bleed into the next sentence."""
+    spans = [(words[start_index], words[end_index]) for start_index, end_index in align_sentences(sentences, words, language)]
+    # add time buffer around the words
+    start_times = [max(start_word.start - 0.3, 0) for start_word, _ in spans]
+    end_times = [end_word.end + 0.3 for _, end_word in spans]
+    if refine_radius and spans:
+        from .energy import refine_boundaries
+
+        refined = refine_boundaries(original_audio, start_times + end_times, radius=refine_radius)
+        for index, (start_time, end_time) in enumerate(zip(refined[: len(spans)], refined[len(spans) :])):
+            # keep the word boundaries inside the clip
+            start_times[index] = min(float(start_time), spans[index][0].start)
+            end_times[index] = max(float(end_time), spans[index][1].end)
+    result = []
+    for (start_word, end_word), start_time, end_time in zip(spans, start_times, end_times):
         chunk = original_audio[floor(start_time * 1000) : floor(end_time * 1000)]
         result.append(
             {"audio": chunk, "start_time": start_time, "end_time": end_time, "start_word": start_word, "end_word": end_word}
@@ -100,8 +460,118 @@ def get_sentences_as_audio(sentences, original_audio, words, language):
     return result
 
 
-def generate_html(audio_path, sentences, output_dir, title, audio_sentences, spinner, temp_dir, audio_bitrate):
-    # Generate a responsive html file with the sentences and corresponding audio players
+def encode_audio(audio_segment, format="mp3", bitrate=None):
+    buffer = io.BytesIO()
+    audio_segment.export(buffer, format=format, bitrate=bitrate)
+    return buffer.getvalue()
+
+
+# output format arguments of ffmpeg for the supported compressed audio codecs
+AUDIO_CODECS = {
+    "mp3": ["-f", "mp3"],
+    "opus": ["-c:a", "libopus", "-f", "opus"],
+    "flac": ["-f", "flac"],
+}
+# bit rates (in kbit/s per channel) accepted by libopus, which rejects the others instead of clamping them like LAME
+OPUS_BITRATES = (0.5, 256)
+
+
+def wav_header(audio_segment):
+    data_size = len(audio_segment.raw_data)
+    block_align = audio_segment.channels * audio_segment.sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,  # PCM
+        audio_segment.channels,
+        audio_segment.frame_rate,
+        audio_segment.frame_rate * block_align,
+        block_align,
+        audio_segment.sample_width * 8,
+        b"data",
+        data_size,
+    )
+
+
+def iter_encoded_audio(audio_segment, codec="mp3", bitrate=None, block_size=64 * 1024):
+    """Encode the audio segment by piping its samples through ffmpeg, yielding the encoded bytes as they come,
+    without any temporary file."""
+    if codec == "wav":
+        # no need for ffmpeg, the samples only need a header
+        yield wav_header(audio_segment)
+        data = audio_segment.raw_data
+        for position in range(0, len(data), block_size):
+            yield data[position : position + block_size]
+        return
+    command = [AudioSegment.converter, "-loglevel", "error", "-f", PCM_FORMATS[audio_segment.sample_width]]
+    command += ["-ar", str(audio_segment.frame_rate), "-ac", str(audio_segment.channels), "-i", "pipe:0"]
+    if bitrate and codec == "opus":
+        kbps = float(bitrate[:-1]) if bitrate.endswith("k") else float(bitrate) / 1000
+        low, high = OPUS_BITRATES
+        bitrate = f"{min(max(kbps, low), high * audio_segment.channels):g}k"
+    # lossless, the bit rate is only the one of the source
+    if bitrate and codec != "flac":
+        command += ["-b:a", bitrate]
+    command += AUDIO_CODECS[codec] + ["pipe:1"]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed():
+        # write the samples from another thread, so that a full stdout pipe can't block ffmpeg
+        try:
+            process.stdin.write(audio_segment.raw_data)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        for block in iter(lambda: process.stdout.read(block_size), b""):
+            yield block
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        feeder.join()
+        process.wait()
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+    if process.returncode:
+        raise RuntimeError(f"Encoding to {codec} failed: {stderr}")
+
+
+def encode_clips(audio_segments, bitrate=None, format="mp3", max_workers=None):
+    """Encode the audio segments in a pool of processes, one per CPU by default, yielding the bytes in order."""
+    if len(audio_segments) < 2:
+        for audio_segment in audio_segments:
+            yield encode_audio(audio_segment, format, bitrate)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        yield from executor.map(encode_audio, audio_segments, repeat(format), repeat(bitrate))
+
+
+def _write_base64(file, path, block_size=3 * 1024 * 1024):
+    # encode the file data to base64 block by block, the block size being a multiple of 3 keeps the output contiguous
+    with open(path, "rb") as audio_file:
+        for block in iter(lambda: audio_file.read(block_size), b""):
+            file.write(base64.b64encode(block).decode("utf-8"))
+
+
+def generate_html(
+    audio_path, sentences, output_dir, title, audio_sentences, spinner, audio_bitrate, max_workers=None, media="files"
+):
+    """Generate a responsive html file with the sentences and corresponding audio players.
+
+    The `media` mode defines where the audio lives:
+    - "files": every clip is written next to the page and loaded on demand from its relative URL;
+    - "fragments": a single copy of the source audio is written next to the page, and every player plays its
+      `#t=start,end` media fragment, so no clip is encoded at all;
+    - "embed": the source audio and the clips are embedded as base64, making the page self-contained."""
     with open(os.path.join(output_dir, f"{title}.html"), "w") as file:
         file.write(
             f"""
@@ -133,52 +603,65 @@ def generate_html(audio_path, sentences, output_dir, title, audio_sentences, spi
             """
         )
         full_text = "<br>".join(sentences)
-        with open(audio_path, "rb") as audio_file:
-            # encode the file data to base64
-            encoded = base64.b64encode(audio_file.read()).decode("utf-8")
-            src = f"data:audio/mp3;base64,{encoded}"
-            file.write(
-                f"""
+        audio_type = mimetypes.guess_type(audio_path)[0] or "audio/mpeg"
+        file.write(
+            f"""
             <section>
                 <div style="max-height: 50vh; overflow: auto;">
                     <p>{full_text}</p>
                 </div>
-                <audio controls><source src="{src}" type="audio/mpeg"></audio>
+                <audio controls preload="none">"""
+        )
+        file.write(f'<source type="{audio_type}" src="')
+        if media == "embed":
+            file.write(f"data:{audio_type};base64,")
+            _write_base64(file, audio_path)
+        else:
+            # a single copy of the source audio next to the page
+            source_name = f"{title}_full{os.path.splitext(audio_path)[1]}"
+            shutil.copyfile(audio_path, os.path.join(output_dir, source_name))
+            record("bytes_written", os.path.getsize(audio_path))
+            file.write(quote(source_name))
+        file.write(
+            """"></audio>
             </section>
             <section>
                 <button id="toggleAutoplay">Commencer à jouer</button>
             </section>
             <div style="max-height: 50vh; overflow: auto;">
             """
+        )
+        if media == "fragments":
+            clips = repeat(None)
+        else:
+            clips = encode_clips([item["audio"] for item in audio_sentences], f"{audio_bitrate}k", max_workers=max_workers)
+        for i, (sentence, item, clip) in enumerate(zip(sentences, audio_sentences, clips)):
+            attributes = ""
+            if media == "fragments":
+                start_time, end_time = item["start_time"], item["end_time"]
+                src = f"{quote(source_name)}#t={start_time:.3f},{end_time:.3f}"
+                attributes = f' data-start="{start_time:.3f}" data-end="{end_time:.3f}"'
+                source_type = audio_type
+            else:
+                # save the audio to a file, and embed the same bytes in the page if needed
+                with open(os.path.join(output_dir, sentence[:30] + ".mp3"), "wb") as audio_file:
+                    audio_file.write(clip)
+                record("bytes_written", len(clip))
+                if media == "embed":
+                    src = "data:audio/mp3;base64," + base64.b64encode(clip).decode("utf-8")
+                else:
+                    src = quote(sentence[:30] + ".mp3")
+                source_type = "audio/mpeg"
+            file.write(
+                f"""
+            <section>
+                <a id="{i+1}" href="#{i+1}">{i+1}.</a>
+                <p>{sentence}</p>
+                <audio title="{sentence[:30]}.mp3" controls preload="none"{attributes}>
+                    <source src="{src}" type="{source_type}">
+                </audio>
+            </section>"""
             )
-        for i, sentence in enumerate(sentences):
-            item = audio_sentences[i]
-            audio_segment = item["audio"]
-            # start_word = item["start_word"]
-            # end_word = item["end_word"]
-            # write to tempfile
-            with tempfile.TemporaryFile(dir=temp_dir) as audio_file:
-                audio_segment.export(audio_file, format="mp3", bitrate=f"{audio_bitrate}k")
-                audio_file.seek(0)
-                # encode the file data to base64
-                encoded = base64.b64encode(audio_file.read()).decode("utf-8")
-                src = f"data:audio/mp3;base64,{encoded}"
-
-                # with open(output_dir + "/" + sentence[:30] + ".mp3", "a") as f:
-                #  f.write(src)
-		
-                # save the audio to a file
-                audio_segment.export(
-                  os.path.join(output_dir, sentence[:30] + ".mp3"), format="mp3")
-
-                file.write(
-                    f"""
-                <section>
-                    <a id="{i+1}" href="#{i+1}">{i+1}.</a>
-                    <p>{sentence}</p>
-                    <audio title="{sentence[:30]}.mp3" controls><source src="{src}" type="audio/mpeg"></audio>
-                </section>"""
-                )
             spinner.next()
         file.write(
             """
@@ -196,16 +679,27 @@ def generate_html(audio_path, sentences, output_dir, title, audio_sentences, spi
                     });
 
                     audioElements.forEach((audio, index) => {
-                        audio.addEventListener('ended', () => {
+                        // media fragment players pause at the end of the fragment instead of ending
+                        const duration = () => audio.dataset.end ? audio.dataset.end - audio.dataset.start : audio.duration;
+                        const playNext = () => {
                             if (autoplayEnabled) {
                                 const nextAudio = audioElements[index + 1];
                                 if (nextAudio) {
                                     setTimeout(() => {
                                         nextAudio.parentElement.scrollIntoView({ behavior: 'smooth' });
+                                        if (nextAudio.dataset.start) {
+                                            nextAudio.currentTime = nextAudio.dataset.start;
+                                        }
                                         nextAudio.play();
-                                    }, 1.5 * audio.duration * 1000);
+                                    }, 1.5 * duration() * 1000);
                                 }
                             }
+                        };
+                        audio.addEventListener('ended', playNext);
+                        audio.addEventListener('pause', () => {
+                            if (audio.dataset.end && audio.currentTime >= audio.dataset.end - 0.1) {
+                                playNext();
+                            }
                         });
                     });
                 });
@@ -213,6 +707,7 @@ def generate_html(audio_path, sentences, output_dir, title, audio_sentences, spi
             </body>
             </html>"""
         )
+    record("bytes_written", os.path.getsize(os.path.join(output_dir, f"{title}.html")))
 
 
 def float_range(mini=None, maxi=None):
@@ -237,19 +732,137 @@ def float_range(mini=None, maxi=None):
     return float_range_checker
 
 
-def text_to_speech(text_path, temp_dir):
+def text_to_speech(text_path, temp_dir, language="english"):
+    """Synthesize the speech of the text file, a sentence per request, the requests being made concurrently.
+
+    Return the path of the audio and its transcript, i.e. the `(language, text, words)` tuple, known from the times of
+    the sentences in the audio, so that the audio doesn't need to be transcribed. The times of the words are spread
+    over their sentence, whose bounds are exact."""
+    from openai.types.audio import TranscriptionWord
+
+    from .tts import encode_speech, synthesize
+
     logger.info("\nConverting text to speech...")
     with open(text_path, "r") as file:
         text = file.read()
-        response = client.audio.speech.create(
-            model="tts-1-hd",
-            voice="alloy",
-            input=text,
-        )
-        audio_path = os.path.join(temp_dir, "text_audio.mp3")
-        response.write_to_file(audio_path)
-        logger.info("\nText converted to speech successfully!")
-        return audio_path
+    sentences, sentence_words = [], []
+    for sentence in split_text_into_sentences(text, language):
+        tokens = split_text_into_words(sentence, language)
+        if tokens:
+            sentences.append(sentence)
+            sentence_words.append(tokens)
+    if not sentences:
+        raise ValueError("The text has no words to convert to speech.")
+    pcm_path = os.path.join(temp_dir, "text_audio.pcm")
+    timings = synthesize(sentences, pcm_path, temp_dir)
+    audio_path = encode_speech(pcm_path, os.path.join(temp_dir, "text_audio.mp3"))
+    os.unlink(pcm_path)
+    words = []
+    for tokens, (start, end) in zip(sentence_words, timings):
+        # in proportion to the length of the words
+        total, position = sum(len(token) for token in tokens), start
+        for token in tokens:
+            word_end = position + (end - start) * len(token) / total
+            words.append(TranscriptionWord(word=token, start=round(position, 3), end=round(word_end, 3)))
+            position = word_end
+    logger.info("\nText converted to speech successfully!")
+    return audio_path, (language, " ".join(sentences), words)
+
+
+def process_file(input_path, output_dir, args, cache, spinner, encode_workers=None, backend=None):
+    """Split a single input file, writing the resulting page to the output directory.
+
+    Return the `Metrics` of the stages of the processing."""
+    spinner.next()
+    title = os.path.basename(input_path).split(".")[0]
+    metrics = Metrics(input_path)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # known without transcribing the audio, for the speech synthesized from a text
+        transcript = None
+        with metrics.stage("input"):
+            input_content_type = mimetypes.guess_type(input_path)[0] or ""
+            if input_content_type.startswith("video"):
+                logger.info("\nInput file is a video file.")
+                # Extract audio from the video
+                audio_path = extract_audio(input_path, temp_dir)
+            elif input_content_type.startswith("audio"):
+                logger.info("\nInput file is an audio file.")
+                audio_path = input_path
+            elif input_content_type.startswith("text"):
+                audio_path, transcript = text_to_speech(input_path, temp_dir, args.language)
+            else:
+                raise ValueError("Input file is not a valid audio or video file.")
+            # in kbps, as ffmpeg expects it
+            audio_bitrate = int(mediainfo(audio_path)["bit_rate"]) // 1000
+            if args.offset or args.end is not None:
+                # cut the excerpt at the container level, copying the audio stream when its format allows it, so that
+                # it's neither decoded nor re-encoded; the transcription and the clips are then taken from the excerpt
+                extension = os.path.splitext(audio_path)[1].lower()
+                copy = extension in STREAM_COPY_EXTENSIONS
+                excerpt_path = os.path.join(temp_dir, f"excerpt{extension if copy else '.mp3'}")
+                arguments = [] if copy else ["-b:a", f"{audio_bitrate}k"]
+                audio_path = cut_audio(audio_path, excerpt_path, args.offset or 0, args.end, copy=copy, arguments=arguments)
+                # the excerpt is transcribed instead
+                transcript = None
+
+        with metrics.stage("decoding"):
+            # Load the original audio for accurate sentence splitting
+            if args.slicing == "seek":
+                audio = AudioFile(audio_path)
+            elif args.slicing == "pcm":
+                from .pcm import PcmCache
+
+                audio = PcmCache().load(audio_path)
+            else:
+                audio = AudioSegment.from_file(audio_path)
+        spinner.next()
+
+        with metrics.stage("transcription"):
+            # Transcribe the chunks and combine the text
+            language, full_text, words = transcript or transcribe_audio(
+                audio_path,
+                audio=audio,
+                chunk_length=args.chunk_length,
+                max_workers=args.workers,
+                cache=cache,
+                upload_format=args.upload_format,
+                trim_silence=args.trim_silence,
+                backend=backend,
+            )
+        spinner.next()
+
+        if args.log_level == "DEBUG":
+            # save the audio to a file
+            audio.export(os.path.join(output_dir, f"{title}_extracted_audio.mp3"), format="mp3", bitrate=f"{audio_bitrate}k")
+
+            # save the transcribed text to a file
+            with open(os.path.join(output_dir, f"{title}_transcribed_text.txt"), "w") as file:
+                file.write(full_text)
+            spinner.next()
+
+            # save words to a file
+            with open(os.path.join(output_dir, f"{title}_words.json"), "w") as file:
+                file.write(str(words))
+            spinner.next()
+
+        with metrics.stage("alignment"):
+            # Split the transcribed text into sentences
+            sentences = split_text_into_sentences(full_text, language)
+            spinner.next()
+
+            # Save each sentence as a separate audio file
+            audio_sentences = get_sentences_as_audio(sentences, audio, words, language, args.refine_radius)
+        spinner.next()
+
+        # the clips are encoded while the page is written
+        with metrics.stage("encoding"):
+            generate_html(
+                audio_path, sentences, output_dir, title, audio_sentences, spinner, audio_bitrate, encode_workers, args.media
+            )
+
+    logger.info(f"\n{input_path}: audio split into sentences successfully!")
+    return metrics
 
 
 def main():
@@ -273,6 +886,131 @@ def main():
         ),
         help="Offset in seconds to start the audio from.",
     )
+    parser.add_argument(
+        "--end",
+        type=float_range(mini=0),
+        help="Position in seconds to stop the audio at, to process only an excerpt of a long recording.",
+    )
+    parser.add_argument(
+        "--media",
+        choices=["files", "fragments", "embed"],
+        default="files",
+        help="""How the page references the audio: "files" writes every sentence clip next to the page,
+                "fragments" plays the fragments of a single copy of the source audio, and "embed" embeds all the audio
+                in the page, making it self-contained but much bigger. Default is "files".""",
+    )
+    parser.add_argument(
+        "--slicing",
+        choices=["seek", "pcm", "memory"],
+        default="seek",
+        help="""How the sentence clips are cut: "seek" decodes only the window of every clip from the source file,
+                keeping the memory use flat, "pcm" decodes the recording once to a cached PCM file that is memory-mapped,
+                so that processing it again skips the decoding, and "memory" decodes the whole recording in memory.
+                Default is "seek".""",
+    )
+    parser.add_argument(
+        "--refine-radius",
+        type=float_range(mini=0),
+        default=0,
+        help="""Snap the start and end of every sentence clip to the quietest point within this many seconds,
+                instead of only adding a fixed margin around the words. Default is 0 (disabled).""",
+    )
+    parser.add_argument(
+        "--chunk-length",
+        type=float_range(mini=0),
+        default=600,
+        help="""Transcribe recordings longer than this many seconds in overlapping chunks, split at quiet points.
+                Use 0 to always send the whole recording at once. Default is 600.""",
+    )
+    parser.add_argument(
+        "--upload-format",
+        choices=["opus", "mp3"],
+        help="""Re-encode the audio to a compact 16 kHz mono format before uploading it for transcription, which
+                is much smaller than most sources. The clips are still cut from the original audio.""",
+    )
+    parser.add_argument(
+        "--trim-silence",
+        action="store_true",
+        help="""Remove the silences longer than a second before uploading the audio for transcription, which makes
+                the upload smaller and the transcription cheaper. The clips are still cut from the original audio.""",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always transcribe the audio, bypassing the transcription cache.",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove all the cached transcriptions and decoded audio before processing.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="""Number of input files processed at the same time, so that the transcription of some files
+                overlaps with the decoding and encoding of the others. Default is 1.""",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="openai",
+        help="""Transcription backend: the OpenAI API, or "replay" to replay the transcription recorded in the
+                --replay-file JSON file without any API call, e.g. for load tests. Default is openai.""",
+    )
+    parser.add_argument(
+        "--replay-file",
+        help="""JSON file with the "language", "text" and "words" (with their "word", "start" and "end") of the
+                transcription replayed by the replay backend, like the entries of the transcription cache.""",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=float_range(mini=0),
+        default=0,
+        help="Seconds the replay backend waits before answering every request, to simulate the API. Default is 0.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Maximum number of chunks transcribed concurrently. Default is 4.",
+    )
+    parser.add_argument(
+        "--language",
+        default="english",
+        help="""Language of the text input files, for splitting them into sentences, as named by NLTK.
+                Default is english.""",
+    )
+    parser.add_argument(
+        "--api-concurrency",
+        type=int,
+        default=8,
+        help="""Maximum number of API requests in flight, for all the files and chunks processed at the same time.
+                Default is 8.""",
+    )
+    parser.add_argument(
+        "--api-rate",
+        type=float_range(mini=0),
+        help="Maximum number of API requests started per minute, to stay within the quota. Unlimited by default.",
+    )
+    parser.add_argument(
+        "--api-retries",
+        type=int,
+        default=5,
+        help="""Number of times a request failing with a transient error (rate limit, timeout, dropped connection or
+                server error) is retried, after an exponential backoff. Default is 5.""",
+    )
+    parser.add_argument(
+        "--api-timeout",
+        type=float_range(mini=0),
+        default=600,
+        help="Timeout of every API request, in seconds. Default is 600.",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        help="""Write the wall time, CPU time, peak memory, bytes uploaded and bytes written of every stage
+                of the processing of every file as JSON to this path, or to the standard output for "-".""",
+    )
     # log level
     parser.add_argument(
         "--log-level",
@@ -284,76 +1022,58 @@ def main():
     parser.add_argument("--version", action="version", version=f"%(prog)s {version('speech-splitter')}")
 
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.api_concurrency < 1:
+        parser.error("--api-concurrency must be at least 1")
+    if args.end is not None and args.end <= (args.offset or 0):
+        parser.error("--end must be after --offset")
+    if args.backend == "replay" and not args.replay_file:
+        parser.error("--backend replay requires --replay-file")
     # set log level
     logger.setLevel(args.log_level)
     # check for input and output paths not being the same
     if args.input_path == args.output_path:
         raise ValueError("Input and output paths cannot be the same.")
+    configure_transport(
+        concurrency=args.api_concurrency,
+        rate=args.api_rate and args.api_rate / 60,
+        retries=max(args.api_retries, 0),
+        timeout=args.api_timeout,
+    )
+    backend = create_backend(args.backend, args.replay_file, args.replay_latency)
+    cache = None if args.no_cache else TranscriptionCache()
+    if args.clear_cache:
+        from .pcm import PcmCache
+
+        TranscriptionCache().clear()
+        PcmCache().clear()
     with Spinner("Loading...") as spinner:
-        nltk.download("punkt_tab")
+        ensure_tokenizer_data()
         output_dir = args.output_path
         os.makedirs(output_dir, exist_ok=True)
-        for input_path in args.input_path:
-            spinner.next()
-            title = os.path.basename(input_path).split(".")[0]
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                input_content_type = mimetypes.guess_type(input_path)[0]
-                if input_content_type.startswith("video"):
-                    logger.info("\nInput file is a video file.")
-                    # Extract audio from the video
-                    audio_path = os.path.join(temp_dir, "audio.mp3")
-                    video = mp.VideoFileClip(input_path)
-                    video.audio.write_audiofile(audio_path)
-                elif input_content_type.startswith("audio"):
-                    logger.info("\nInput file is an audio file.")
-                    audio_path = input_path
-                elif input_content_type.startswith("text"):
-                    audio_path = text_to_speech(input_path, temp_dir)
-                else:
-                    logger.error("\nError: Input file is not a valid audio or video file.")
-                    sys.exit(1)
-                # Load the original audio for accurate sentence splitting
-                audio = AudioSegment.from_mp3(audio_path)
-                audio_bitrate = mediainfo(audio_path)["bit_rate"]
-
-                spinner.next()
-
-                if args.offset:
-                    audio = audio[args.offset * 1000 :]
-                    # save audio to a new file
-                    audio_path = os.path.join(temp_dir, "offset_audio.mp3")
-                    audio.export(audio_path, format="mp3", bitrate=f"{audio_bitrate}k")
-                    spinner.next()
-
-                # Transcribe the chunks and combine the text
-                language, full_text, words = transcribe_audio(audio_path)
-                spinner.next()
-
-                if args.log_level == "DEBUG":
-                    # save the audio to a file
-                    audio.export(
-                        os.path.join(output_dir, f"{title}_extracted_audio.mp3"), format="mp3", bitrate=f"{audio_bitrate}k"
-                    )
-
-                    # save the transcribed text to a file
-                    with open(os.path.join(output_dir, f"{title}_transcribed_text.txt"), "w") as file:
-                        file.write(full_text)
-                    spinner.next()
-
-                    # save words to a file
-                    with open(os.path.join(output_dir, f"{title}_words.json"), "w") as file:
-                        file.write(str(words))
-                    spinner.next()
-
-                # Split the transcribed text into sentences
-                sentences = split_text_into_sentences(full_text, language)
-                spinner.next()
-
-                # Save each sentence as a separate audio file
-                audio_sentences = get_sentences_as_audio(sentences, audio, words, language)
-                spinner.next()
-
-                generate_html(audio_path, sentences, output_dir, title, audio_sentences, spinner, temp_dir, audio_bitrate)
-
-            logger.info("\nAudio split into sentences successfully!")
\ No newline at end of file
+        # share the CPUs between the files processed at the same time
+        encode_workers = max((os.cpu_count() or 1) // args.jobs, 1)
+        failed, metrics = {}, {}
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = {
+                executor.submit(
+                    process_file, input_path, output_dir, args, cache, spinner, encode_workers, backend
+                ): input_path
+                for input_path in args.input_path
+            }
+            for future in as_completed(futures):
+                input_path = futures[future]
+                try:
+                    metrics[input_path] = future.result()
+                except Exception as exc:
+                    logger.error(f"\nError processing {input_path}: {exc}")
+                    logger.debug("", exc_info=exc)
+                    failed[input_path] = exc
+    logger.info(f"\nProcessed {len(args.input_path) - len(failed)} of {len(args.input_path)} file(s) successfully.")
+    for input_path, exc in failed.items():
+        logger.info(f"Failed: {input_path} ({exc})")
+    if args.metrics_out:
+        write_metrics([metrics[input_path] for input_path in args.input_path if input_path in metrics], args.metrics_out)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+TRANSIENT_STATUS_CODES = {408, 409, 429}
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def is_transient(error):
+    """Whether the API error is worth retrying, i.e. a dropped connection, a timeout, a rate limit or a server error."""
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in TRANSIENT_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    """The delay (in seconds) the server asks for in the `Retry-After` header of the error response, if any."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Rate limiter letting `rate` requests per second through on average, in bursts of up to `capacity` requests.
+
+    The tokens are taken in advance, so the requests are let through in their order of arrival."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self):
+        """Take a token, returning the time to wait (in seconds) before it's available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0)
+
+
+class Transport:
+    """Runs the API requests on an event loop of its own, in a background thread, so that they share the connections
+    of its client, whatever the thread they're made from.
+
+    At most `concurrency` requests are in flight, started at no more than `rate` per second (unlimited if None),
+    and the transient errors are retried up to `retries` times, after an exponential backoff with full jitter."""
+
+    def __init__(self, concurrency=8, rate=None, retries=5, backoff=1.0, max_backoff=60.0, timeout=600.0):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # of every request, in seconds
+        self.timeout = timeout
+        self._bucket = TokenBucket(rate) if rate else None
+        self._semaphore = None
+        self._client = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="transport", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    @property
+    def client(self):
+        """The asynchronous OpenAI client of the requests, created on first use on the event loop, which its
+        connections are bound to.
+
+        The requests are retried by the transport, so the client itself doesn't."""
+        if self._client is None:
+            if threading.current_thread() is self._thread:
+                from openai import AsyncOpenAI
+
+                self._client = AsyncOpenAI(max_retries=0)
+            else:
+                asyncio.run_coroutine_threadsafe(self._get_client(), self._start()).result()
+        return self._client
+
+    async def _get_client(self):
+        return self.client
+
+    def _delay(self, attempt, error):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        return max(delay, retry_after(error) or 0)
+
+    async def call(self, function, *args, **kwargs):
+        """Await `function(*args, **kwargs)`, an API request, within the limits, retrying it on transient errors."""
+        if self._semaphore is None:
+            # created on the event loop, which it's bound to
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                if self._bucket is not None:
+                    await asyncio.sleep(self._bucket.delay())
+                try:
+                    return await function(*args, **kwargs)
+                except Exception as e:
+                    if attempt == self.retries or not is_transient(e):
+                        raise
+                    delay = self._delay(attempt, e)
+                    logger.warning(f"\n{e.__class__.__name__}: {e}, retrying in {delay:.1f}s ({attempt + 1}/{self.retries})")
+                    await asyncio.sleep(delay)
+
+    def run(self, function, *args, **kwargs):
+        """Run `call()` on the event loop of the transport from another thread, blocking until its result."""
+        return asyncio.run_coroutine_threadsafe(self.call(function, *args, **kwargs), self._start()).result()
+
+    def gather(self, function, calls):
+        """Run `call()` for every tuple of arguments in `calls` concurrently, from another thread, blocking until
+        their results, in order.
+
+        Every request is a call of its own, so that it takes its own slot and is retried on its own."""
+        calls = [self.call(function, *args) for args in calls]
+        return asyncio.run_coroutine_threadsafe(self._gather(calls), self._start()).result()
+
+    async def _gather(self, calls):
+        return await asyncio.gather(*calls)
+
+    def close(self):
+        """Cancel the requests in flight, close the client and stop the event loop and its thread."""
+        with self._lock:
+            loop, thread, self._loop, self._thread = self._loop, self._thread, None, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        self._semaphore = self._client = None
+
+    async def _close(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.close()
+
+
+def get_transport():
+    """Return the transport of the API requests, created with the default settings on first use."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+    return _transport
+
+
+def configure_transport(**options):
+    """Replace the transport of the API requests by one with the given `Transport` options, closing the previous one."""
+    global _transport
+    with _transport_lock:
+        previous, _transport = _transport, Transport(**options)
+    if previous is not None:
+        previous.close()
+    return _transport
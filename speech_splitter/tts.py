@@ -0,0 +1,87 @@
+import logging
+import os
+import shutil
+
+from .backends import get_client
+from .media import run_ffmpeg
+from .metrics import record
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+MODEL = "tts-1-hd"
+VOICE = "alloy"
+# characters of the input of a speech request
+MAX_INPUT_LENGTH = 4096
+# the raw PCM returned by the API: 16-bit mono at 24 kHz
+FRAME_RATE = 24000
+SAMPLE_WIDTH = 2
+# silence between the sentences, longer than the margins of the clips cut around them
+PAUSE = 0.75
+
+
+def split_input(sentences, max_length=MAX_INPUT_LENGTH):
+    """Return the `(sentence index, text)` inputs of the speech requests: a sentence per request, the sentences
+    longer than `max_length` characters being split between their words."""
+    inputs = []
+    for index, sentence in enumerate(sentences):
+        piece = ""
+        for word in sentence.split():
+            if piece and len(piece) + 1 + len(word) > max_length:
+                inputs.append((index, piece))
+                piece = ""
+            # a single word longer than the limit is cut
+            while len(word) > max_length:
+                inputs.append((index, word[:max_length]))
+                word = word[max_length:]
+            piece = f"{piece} {word}" if piece else word
+        if piece:
+            inputs.append((index, piece))
+    return inputs
+
+
+async def _synthesize(text, path):
+    # streamed to the file as it's received, so that the audio is never held in memory
+    async with get_client().audio.speech.with_streaming_response.create(
+        model=MODEL,
+        voice=VOICE,
+        input=text,
+        response_format="pcm",
+        timeout=get_transport().timeout,
+    ) as response:
+        await response.stream_to_file(path)
+
+
+def synthesize(sentences, output_path, temp_dir, max_length=MAX_INPUT_LENGTH, pause=PAUSE):
+    """Synthesize the speech of the sentences concurrently, concatenated in order with a pause between them,
+    to `output_path` as raw 16-bit mono PCM at `FRAME_RATE`.
+
+    Return the `(start, end)` times (in seconds) of every sentence in the audio."""
+    inputs = split_input(sentences, max_length)
+    record("bytes_uploaded", sum(len(text.encode()) for _, text in inputs))
+    paths = [os.path.join(temp_dir, f"speech_{index}.pcm") for index in range(len(inputs))]
+    # as many at the same time as the transport allows
+    get_transport().gather(_synthesize, [(text, path) for (_, text), path in zip(inputs, paths)])
+    starts, timings = {}, []
+    bytes_per_second = FRAME_RATE * SAMPLE_WIDTH
+    silence = bytes(int(pause * FRAME_RATE) * SAMPLE_WIDTH)
+    with open(output_path, "wb") as output:
+        output.write(silence)
+        for position, ((index, _), path) in enumerate(zip(inputs, paths)):
+            starts.setdefault(index, output.tell() / bytes_per_second)
+            with open(path, "rb") as file:
+                shutil.copyfileobj(file, output)
+            os.unlink(path)
+            # the pieces of a sentence are played without a pause
+            if position + 1 == len(inputs) or inputs[position + 1][0] != index:
+                timings.append((starts[index], output.tell() / bytes_per_second))
+                output.write(silence)
+    return timings
+
+
+def encode_speech(pcm_path, output_path, bitrate="128k"):
+    """Encode the raw PCM returned by `synthesize()` to MP3."""
+    run_ffmpeg(
+        "-f", "s16le", "-ar", str(FRAME_RATE), "-ac", "1", "-i", pcm_path, "-c:a", "libmp3lame", "-b:a", bitrate, output_path
+    )
+    return output_path
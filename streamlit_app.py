@@ -1,22 +1,57 @@
 import streamlit as st
 import os
 import tempfile
-import base64
-from math import floor
-import mimetypes
+from math import ceil, floor
 import logging
 import zipfile
-import io
-from pydub import AudioSegment
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from pydub.utils import mediainfo
-import moviepy.editor as mp
-import nltk
-nltk.download('punkt_tab')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Processed files are kept in memory, shared between reruns and sessions, up to this many files and seconds
+RESULTS_CACHE_MAX_ENTRIES = int(os.getenv("RESULTS_CACHE_MAX_ENTRIES", "8"))
+RESULTS_CACHE_TTL = int(os.getenv("RESULTS_CACHE_TTL", "3600"))
+# Files processed at the same time in the background, by all the sessions
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Decodings, transcriptions and encodings run at the same time by all the sessions, the others wait in line
+DECODING_SLOTS = int(os.getenv("DECODING_SLOTS", "2"))
+TRANSCRIPTION_SLOTS = int(os.getenv("TRANSCRIPTION_SLOTS", "4"))
+ENCODING_SLOTS = int(os.getenv("ENCODING_SLOTS", "2"))
+# Memory of the decoded audio of the files being processed; longer files are rejected
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "2048"))
+# Encoded sentence clips kept per session
+CLIPS_CACHE_MAX_ENTRIES = int(os.getenv("CLIPS_CACHE_MAX_ENTRIES", "100"))
+PAGE_SIZES = [10, 25, 50, 100]
+# Compact format the audio is re-encoded to before the upload for transcription ("opus", "mp3" or "" to upload as is)
+UPLOAD_FORMAT = os.getenv("UPLOAD_FORMAT", "opus") or None
+# Remove the long pauses between the sentences before the upload for transcription
+TRIM_SILENCE = os.getenv("TRIM_SILENCE", "1") == "1"
+# Transcription backend: "openai", or "replay" to replay the transcription of REPLAY_FILE offline, e.g. for load tests
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "openai")
+REPLAY_FILE = os.getenv("REPLAY_FILE")
+REPLAY_LATENCY = float(os.getenv("REPLAY_LATENCY", "0"))
+# API requests in flight and started per minute (unlimited if 0) by all the sessions, retries of the transient errors
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "8"))
+API_RATE_PER_MINUTE = float(os.getenv("API_RATE_PER_MINUTE", "0"))
+API_RETRIES = int(os.getenv("API_RETRIES", "5"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "600"))
+# Uploads being processed
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "speech-splitter-uploads"))
+# Audio formats of the fragments in the zip file
+AUDIO_FORMATS = {
+    "mp3": "MP3",
+    "opus": "Opus",
+    "flac": "FLAC (lossless)",
+    "wav": "WAV (uncompressed)",
+}
+# Bit rate of the Opus fragments, plenty for speech
+OPUS_BITRATE = os.getenv("OPUS_BITRATE", "64k")
+
 # Set page config
 st.set_page_config(
     page_title="Clap Studio Speech Splitter",
@@ -48,15 +83,31 @@ TRANSLATIONS = {
         "language_detected": "Language detected:",
         "download_fragments": "📥 Download Audio Fragments",
         "download_description": "Download all audio fragments as a zip file containing:",
-        "individual_files": "• Individual WAV files for each sentence",
+        "individual_files": "• Individual audio files for each sentence",
         "transcript_file": "• Full transcript as text file",
         "metadata_file": "• Metadata with timing information",
         "download_zip": "📦 Download ZIP",
+        "audio_format": "Audio format",
+        "prepare_zip": "🗜️ Prepare ZIP",
+        "preparing_zip": "Preparing the ZIP file...",
         "full_transcript": "📝 Full Transcript",
+        "processing_metrics": "⏱️ Processing Metrics",
+        "processing": "⏳ Processing the file:",
+        "queued": "waiting for a free worker...",
+        "stages": {
+            "input": "reading the input...",
+            "decoding": "decoding the audio...",
+            "transcription": "transcribing the audio...",
+            "alignment": "splitting into sentences...",
+            "memory": "waiting for memory to be available...",
+        },
+        "waiting": "{stage} (position {position} in the queue)",
         "sentence_audio": "🎧 Sentence-by-Sentence Audio",
         "enable_autoplay": "Enable Autoplay",
         "autoplay_help": "Automatically play the next sentence when one ends",
         "time": "Time:",
+        "sentences_per_page": "Sentences per page",
+        "page": "Page",
         "logout": "🚪 Logout",
         "about": "ℹ️ About",
         "about_description": "This app uses OpenAI's Whisper model to transcribe audio and split it into individual sentences. Each sentence gets its own audio player for easy listening practice.",
@@ -89,15 +140,31 @@ TRANSLATIONS = {
         "language_detected": "Langue détectée:",
         "download_fragments": "📥 Télécharger les Fragments Audio",
         "download_description": "Téléchargez tous les fragments audio sous forme de fichier zip contenant:",
-        "individual_files": "• Fichiers WAV individuels pour chaque phrase",
+        "individual_files": "• Fichiers audio individuels pour chaque phrase",
         "transcript_file": "• Transcription complète en fichier texte",
         "metadata_file": "• Métadonnées avec informations de timing",
         "download_zip": "📦 Télécharger ZIP",
+        "audio_format": "Format audio",
+        "prepare_zip": "🗜️ Préparer le ZIP",
+        "preparing_zip": "Préparation du fichier ZIP...",
         "full_transcript": "📝 Transcription Complète",
+        "processing_metrics": "⏱️ Mesures du Traitement",
+        "processing": "⏳ Traitement du fichier:",
+        "queued": "en attente d'un processus libre...",
+        "stages": {
+            "input": "lecture du fichier...",
+            "decoding": "décodage de l'audio...",
+            "transcription": "transcription de l'audio...",
+            "alignment": "découpage en phrases...",
+            "memory": "en attente de mémoire disponible...",
+        },
+        "waiting": "{stage} (position {position} dans la file d'attente)",
         "sentence_audio": "🎧 Audio Phrase par Phrase",
         "enable_autoplay": "Activer la Lecture Automatique",
         "autoplay_help": "Lire automatiquement la phrase suivante quand une se termine",
         "time": "Temps:",
+        "sentences_per_page": "Phrases par page",
+        "page": "Page",
         "logout": "🚪 Déconnexion",
         "about": "ℹ️ À Propos",
         "about_description": "Cette application utilise un modèle d’IA pour transcrire l'audio et le diviser en phrases individuelles. Cela permet d'obtenir, à partir d'une session d'enregistrement avec un comédien voix, une liste de fichiers individuels facilement exploitables, nommés en vue du montage d'une scène.",
@@ -196,133 +263,238 @@ def check_openai_key():
 
 def import_speech_splitter():
     """Import speech splitter functions only when needed"""
+    from speech_splitter.cache import TranscriptionCache
+    from speech_splitter.media import extract_audio
+    from speech_splitter.pcm import PcmCache
     from speech_splitter.splitter import (
         transcribe_audio, 
         split_text_into_sentences, 
         get_sentences_as_audio,
-        split_text_into_words
+        split_text_into_words,
+        ensure_tokenizer_data,
+    )
+    # only downloaded when missing, instead of on every rerun of the script
+    ensure_tokenizer_data()
+    return (
+        transcribe_audio,
+        split_text_into_sentences,
+        get_sentences_as_audio,
+        split_text_into_words,
+        TranscriptionCache,
+        PcmCache,
+        extract_audio,
     )
-    return transcribe_audio, split_text_into_sentences, get_sentences_as_audio, split_text_into_words
 
-def process_audio_file(uploaded_file):
-    """Process the uploaded audio file and return transcription results"""
-    
-    # Check OpenAI API key first
-    check_openai_key()
+def process_audio_file(file_name, path, progress=lambda stage, position=None: None, scheduler=None):
+    """Process the uploaded audio file saved to `path`, removing it once done, and return transcription results
+
+    Runs in a worker thread of the job queue, so it reports the stages it starts, and its position in the line
+    of the scheduler when it waits for one, to `progress` instead of writing to the page."""
     
     # Import speech splitter functions
-    transcribe_audio, split_text_into_sentences, get_sentences_as_audio, split_text_into_words = import_speech_splitter()
-    
-    # Create a temporary file to store the uploaded audio
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        temp_path = tmp_file.name
+    (
+        transcribe_audio,
+        split_text_into_sentences,
+        get_sentences_as_audio,
+        split_text_into_words,
+        TranscriptionCache,
+        PcmCache,
+        extract_audio,
+    ) = import_speech_splitter()
     
+    from speech_splitter.backends import create_backend
+    from speech_splitter.media import media_type
+    from speech_splitter.metrics import Metrics
+
+    backend = create_backend(TRANSCRIPTION_BACKEND, REPLAY_FILE, REPLAY_LATENCY)
+
+    # Time the same stages as the command line, shown with the results
+    metrics = Metrics(file_name, hook=lambda name, stage: logger.info(f"{name}: {stage}"))
+
+    scheduler = scheduler or get_scheduler()
+
+    @contextmanager
+    def stage(name):
+        with scheduler.slot(name, waiting=lambda position: progress(name, position)):
+            progress(name)
+            with metrics.stage(name):
+                yield
+
+    temp_path = path
     try:
-        # Determine content type and process accordingly
-        content_type = mimetypes.guess_type(temp_path)[0]
-        
         with tempfile.TemporaryDirectory() as temp_dir:
-            if content_type and content_type.startswith("video"):
-                st.info("Input file is a video file. Extracting audio...")
-                # Extract audio from video
-                audio_path = os.path.join(temp_dir, "audio.mp3")
-                video = mp.VideoFileClip(temp_path)
-                video.audio.write_audiofile(audio_path)
-                os.unlink(temp_path)  # Clean up original file
-                temp_path = audio_path
-            elif content_type and content_type.startswith("audio"):
-                st.info("Input file is an audio file.")
-                audio_path = temp_path
-            else:
-                st.error("Error: Input file is not a valid audio or video file.")
-                return None
-            
-            # Load the original audio for accurate sentence splitting
-            audio = AudioSegment.from_file(audio_path)
-            audio_bitrate = mediainfo(audio_path).get("bit_rate", "128")
+            with stage("input"):
+                # Determine the content type from the streams of the file, and process it accordingly
+                content_type = media_type(temp_path)
+                if content_type == "video":
+                    logger.info("Input file is a video file. Extracting audio...")
+                    # Demux the audio stream of the video with ffmpeg, copying it when possible
+                    audio_path = extract_audio(temp_path, temp_dir)
+                    os.unlink(temp_path)  # Clean up original file
+                    temp_path = audio_path
+                elif content_type == "audio":
+                    logger.info("Input file is an audio file.")
+                    audio_path = temp_path
+                else:
+                    raise ValueError("Error: Input file is not a valid audio or video file.")
             
-            # Transcribe the audio
-            with st.spinner("Transcribing audio..."):
-                language, full_text, words = transcribe_audio(audio_path)
+            # Admitted once the decoded audio fits in the memory budget, rejected right away if it never will
+            with scheduler.reserve(audio_path, waiting=lambda position: progress("memory", position)):
+                with stage("decoding"):
+                    # Load the original audio for accurate sentence splitting
+                    # Decoded once to a memory-mapped PCM file, shared by the sessions and reused for the same content
+                    audio = PcmCache().load(audio_path)
+                    # in kbps, as ffmpeg expects it
+                    audio_bitrate = int(mediainfo(audio_path).get("bit_rate", 128000)) // 1000
             
-            st.success("Transcription complete!")
+                # Transcribe the audio
+                with stage("transcription"):
+                    language, full_text, words = transcribe_audio(
+                        audio_path,
+                        audio=audio,
+                        cache=TranscriptionCache(),
+                        upload_format=UPLOAD_FORMAT,
+                        trim_silence=TRIM_SILENCE,
+                        backend=backend,
+                    )
             
-            # Split the transcribed text into sentences
-            with st.spinner("Splitting text into sentences..."):
-                sentences = split_text_into_sentences(full_text, language)
-            
-            # Get sentences as audio segments
-            with st.spinner("Processing audio segments..."):
-                audio_sentences = get_sentences_as_audio(sentences, audio, words, language)
+                with stage("alignment"):
+                    # Split the transcribed text into sentences
+                    sentences = split_text_into_sentences(full_text, language)
+                
+                    # Get sentences as audio segments
+                    audio_sentences = get_sentences_as_audio(sentences, audio, words, language)
             
-            return {
-                'language': language,
-                'full_text': full_text,
-                'sentences': sentences,
-                'audio_sentences': audio_sentences,
-                'original_audio': audio,
-                'audio_bitrate': audio_bitrate,
-                'title': uploaded_file.name.split('.')[0]
-            }
+                return {
+                    'language': language,
+                    'full_text': full_text,
+                    'sentences': sentences,
+                    'audio_sentences': audio_sentences,
+                    'original_audio': audio,
+                    'audio_bitrate': audio_bitrate,
+                    'metrics': metrics.as_dict(),
+                }
     
     finally:
         # Clean up temporary file
         if os.path.exists(temp_path):
             os.unlink(temp_path)
 
-def create_audio_player(audio_segment, title, audio_bitrate):
-    """Create a base64 encoded audio player for a given audio segment"""
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
-        audio_segment.export(tmp_file.name, format="wav")
-        
-        with open(tmp_file.name, "rb") as audio_file:
-            encoded = base64.b64encode(audio_file.read()).decode("utf-8")
-            src = f"data:audio/wav;base64,{encoded}"
-        
+def save_upload(uploaded_file):
+    """Copy the upload to disk a block at a time, hashing it on the way, and return the path and hash of the copy
+
+    Every upload gets a copy of its own, owned by its job, the hash only identifies the job"""
+    from speech_splitter.cache import copy_file
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    # The extension is kept for the transcription API, which relies on it
+    suffix = os.path.splitext(uploaded_file.name)[1].lower()
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=suffix, delete=False) as tmp_file:
+        pass
+    try:
+        uploaded_file.seek(0)
+        file_hash = copy_file(uploaded_file, tmp_file.name)
+    except BaseException:
         os.unlink(tmp_file.name)
-        
-        return f"""
-        <audio title="{title}" controls style="width: 100%;">
-            <source src="{src}" type="audio/wav">
-            Your browser does not support the audio element.
-        </audio>
-        """
-
-def create_zip_with_audio_fragments(result):
-    """Create a zip file containing all audio fragments and a transcript"""
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        raise
+    return tmp_file.name, file_hash
+
+@st.cache_resource
+def get_scheduler():
+    """Admission control of the processing, shared by all the sessions"""
+    from speech_splitter.scheduler import Scheduler
+
+    limits = {"decoding": DECODING_SLOTS, "transcription": TRANSCRIPTION_SLOTS, "encoding": ENCODING_SLOTS}
+    return Scheduler(limits, memory_budget=MEMORY_BUDGET_MB * 1024 * 1024)
+
+@st.cache_resource
+def setup_transport():
+    """Configure the transport of the API requests, shared by all the sessions"""
+    from speech_splitter.transport import configure_transport
+
+    return configure_transport(
+        concurrency=API_CONCURRENCY,
+        rate=API_RATE_PER_MINUTE / 60 or None,
+        retries=API_RETRIES,
+        timeout=API_TIMEOUT,
+    )
+
+@st.cache_resource
+def get_job_queue():
+    """Queue of the processing jobs, shared by all the sessions, so that a reconnecting client finds its job"""
+    from speech_splitter.jobs import JobQueue
+
+    return JobQueue(max_workers=JOB_WORKERS, ttl=RESULTS_CACHE_TTL, max_finished=RESULTS_CACHE_MAX_ENTRIES)
+
+def get_safe_name(sentence):
+    """Create a safe file name from the sentence"""
+    return sentence[:50].replace(' ', '_').replace('/', '_').replace('\\', '_').replace('.', '').replace(',', '').replace('?', '').replace('!', '')
+
+def get_audio_clip(file_hash, index, audio_segment, audio_bitrate):
+    """Get the MP3 clip of a sentence, keeping the most recently encoded ones in the session"""
+    from speech_splitter.splitter import encode_audio
+
+    clips = st.session_state.setdefault("audio_clips", OrderedDict())
+    key = (file_hash, index)
+    if key in clips:
+        clips.move_to_end(key)
+    else:
+        with get_scheduler().slot("encoding"):
+            clips[key] = encode_audio(audio_segment, format="mp3", bitrate=f"{audio_bitrate}k")
+        while len(clips) > CLIPS_CACHE_MAX_ENTRIES:
+            clips.popitem(last=False)
+    return clips[key]
+
+class ZipStream:
+    """Unseekable file-like object collecting what the zip writer writes, until it is taken"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_zip_with_audio_fragments(result, title, codec="mp3"):
+    """Generate a zip file containing all audio fragments and a transcript, yielding it entry by entry"""
+    from speech_splitter.splitter import iter_encoded_audio
+
+    # MP3 at the bit rate of the source, Opus at a speech bit rate, the lossless codecs at none
+    bitrate = {"mp3": f"{result['audio_bitrate']}k", "opus": OPUS_BITRATE}.get(codec)
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zip_file:
         # Add the full transcript as a text file
-        transcript_filename = f"{result['title']}_transcript.txt"
+        transcript_filename = f"{title}_transcript.txt"
         zip_file.writestr(transcript_filename, result['full_text'])
+        yield stream.take()
         
-        # Add each audio fragment
+        # Add each audio fragment, encoded straight into the zip entry; the audio barely compresses, so store it
         for i, (sentence, audio_item) in enumerate(zip(result['sentences'], result['audio_sentences'])):
             # Create a safe filename from the sentence
-            safe_sentence = sentence[:50].replace(' ', '_').replace('/', '_').replace('\\', '_').replace('.', '').replace(',', '').replace('?', '').replace('!', '')
-            safe_filename = f"{safe_sentence}_{i}.wav"
-            
-            # Export the audio segment to a temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
-                audio_item['audio'].export(tmp_file.name, format="wav")
-                
-                # Read the file and add it to the zip
-                with open(tmp_file.name, "rb") as audio_file:
-                    zip_file.writestr(safe_filename, audio_file.read())
-                
-                # Clean up the temporary file
-                os.unlink(tmp_file.name)
+            safe_filename = f"{get_safe_name(sentence)}_{i}.{codec}"
+            entry = zipfile.ZipInfo(safe_filename, date_time=time.localtime()[:6])
+            entry.compress_type = zipfile.ZIP_STORED
+            with zip_file.open(entry, 'w') as entry_file:
+                for block in iter_encoded_audio(audio_item['audio'], codec, bitrate):
+                    entry_file.write(block)
+                    yield stream.take()
+            yield stream.take()
         
         # Add a metadata file with timing information
         metadata_content = f"""Audio Fragments Metadata
 ========================
 
-Title: {result['title']}
+Title: {title}
 Language: {result['language']}
 Total Sentences: {len(result['sentences'])}
-Audio Format: WAV (uncompressed)
+Audio Format: {AUDIO_FORMATS[codec]}
 
 Sentence Details:
 """
@@ -333,10 +505,23 @@ Sentence Details:
             metadata_content += f"    End: {audio_item['end_time']:.2f}s\n"
             metadata_content += f"    Duration: {audio_item['end_time'] - audio_item['start_time']:.2f}s\n"
         
-        zip_file.writestr(f"{result['title']}_metadata.txt", metadata_content)
-    
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+        zip_file.writestr(f"{title}_metadata.txt", metadata_content)
+    yield stream.take()
+
+def write_zip_with_audio_fragments(result, title, codec="mp3"):
+    """Write the zip file to a temporary file on disk, returning it open"""
+    zip_file = tempfile.TemporaryFile()
+    for chunk in iter_zip_with_audio_fragments(result, title, codec):
+        zip_file.write(chunk)
+    zip_file.seek(0)
+    return zip_file
+
+def rewound(file):
+    """Deferred download data, reading the file from its start when the download is requested"""
+    def data():
+        file.seek(0)
+        return file
+    return data
 
 def main():
     # Check authentication first
@@ -360,95 +545,157 @@ def main():
         help=get_text('upload_help')
     )
     
+    setup_transport()
+    job_queue = get_job_queue()
     if uploaded_file is not None:
-        # Process the file
-        result = process_audio_file(uploaded_file)
+        # Process the file in the background, only once per content
+        if TRANSCRIPTION_BACKEND == "openai":
+            check_openai_key()
+        # Copied to disk and hashed once per upload, not on every rerun
+        uploads = st.session_state.setdefault("uploads", {})
+        file_hash = uploads.get(uploaded_file.file_id)
+        job = job_queue.get(file_hash) if file_hash else None
+        if job is None:
+            path, file_hash = save_upload(uploaded_file)
+            uploads[uploaded_file.file_id] = file_hash
+            # An identical file processed before, or being processed, is recognized by its hash
+            job, submitted = job_queue.submit(
+                file_hash, process_audio_file, uploaded_file.name, path, scheduler=get_scheduler()
+            )
+            if not submitted:
+                # Processed, or being processed, from the copy of the identical upload, this one isn't needed
+                os.unlink(path)
+        # Named after this upload, the job is shared with the identical files of any name
+        title = uploaded_file.name.split('.')[0]
+        # In the URL, to find the job again after a refresh or a reconnection
+        st.query_params["job"] = file_hash
+        st.query_params["title"] = title
+    else:
+        file_hash = st.query_params.get("job")
+        title = st.query_params.get("title", file_hash)
+        job = job_queue.get(file_hash) if file_hash else None
+    
+    result = None
+    if job is not None:
+        if not job.done:
+            stage = get_text('stages').get(job.stage, job.stage) if job.stage else get_text('queued')
+            if job.position:
+                # Waiting for the other files to be processed, in line for the stage
+                stage = get_text('waiting').format(stage=stage, position=job.position)
+            st.info(f"{get_text('processing')} {stage}")
+            # Poll the job until it's finished, without holding the script thread in the meantime
+            time.sleep(1)
+            st.rerun()
+        elif job.error is not None:
+            st.error(str(job.error))
+        else:
+            result = job.result
+    
+    if result:
+        st.success(get_text('file_processed'))
         
-        if result:
-            st.success(get_text('file_processed'))
-            
-            # Display results
-            st.subheader(f"{get_text('results_for')} {result['title']}")
-            st.write(f"**{get_text('language_detected')}** {result['language']}")
-            
-            # Download section
-            st.subheader(get_text('download_fragments'))
-            col1, col2 = st.columns([2, 1])
-            
-            with col1:
-                st.write(get_text('download_description'))
-                st.write(get_text('individual_files'))
-                st.write(get_text('transcript_file'))
-                st.write(get_text('metadata_file'))
-            
-            with col2:
-                # Create and provide download button
-                zip_data = create_zip_with_audio_fragments(result)
-                zip_filename = f"{result['title']}_audio_fragments.zip"
-                
+        # Display results
+        st.subheader(f"{get_text('results_for')} {title}")
+        st.write(f"**{get_text('language_detected')}** {result['language']}")
+        
+        # Download section
+        st.subheader(get_text('download_fragments'))
+        col1, col2 = st.columns([2, 1])
+        
+        with col1:
+            st.write(get_text('download_description'))
+            st.write(get_text('individual_files'))
+            st.write(get_text('transcript_file'))
+            st.write(get_text('metadata_file'))
+        
+        with col2:
+            codec = st.selectbox(get_text('audio_format'), list(AUDIO_FORMATS), format_func=AUDIO_FORMATS.get)
+            zip_filename = f"{title}_audio_fragments.zip"
+            # The zip is only built when it's requested
+            zip_key = (file_hash, title, codec)
+            if st.session_state.get("zip_key") != zip_key:
+                if st.button(get_text('prepare_zip')):
+                    with st.spinner(get_text('preparing_zip')), get_scheduler().slot("encoding"):
+                        st.session_state.zip_file = write_zip_with_audio_fragments(result, title, codec)
+                    st.session_state.zip_key = zip_key
+            if st.session_state.get("zip_key") == zip_key:
+                # The archive is only read when the button is clicked, not on every rerun
                 st.download_button(
                     label=get_text('download_zip'),
-                    data=zip_data,
+                    data=rewound(st.session_state.zip_file),
                     file_name=zip_filename,
                     mime="application/zip",
                     help="Download all audio fragments and metadata as a zip file"
                 )
-            
-            st.divider()
-            
-            # Full text section
-            with st.expander(get_text('full_transcript'), expanded=True):
-                st.write(result['full_text'])
-            
-            # Individual sentences with audio players
-            st.subheader(get_text('sentence_audio'))
-            
-            # Add autoplay toggle
-            col1, col2 = st.columns([1, 4])
-            with col1:
-                autoplay = st.checkbox(get_text('enable_autoplay'), help=get_text('autoplay_help'))
-            
-            # Create a container for the audio players
-            audio_container = st.container()
-            
-            with audio_container:
-                for i, (sentence, audio_item) in enumerate(zip(result['sentences'], result['audio_sentences'])):
-                    with st.container():
-                        st.markdown(f"**{i+1}.** {sentence}")
-                        
-                        # Create audio player
-                        audio_html = create_audio_player(
-                            audio_item['audio'], 
-                            f"{sentence[:50].replace(' ', '_').replace('/', '_').replace('\\', '_').replace('.', '').replace(',', '').replace('?', '').replace('!', '')}", 
-                            result['audio_bitrate']
-                        )
-                        st.markdown(audio_html, unsafe_allow_html=True)
-                        
-                        # Show timing information
-                        st.caption(f"{get_text('time')} {audio_item['start_time']:.2f}s - {audio_item['end_time']:.2f}s")
-                        st.divider()
-            
-            # Add JavaScript for autoplay functionality if enabled
-            if autoplay:
-                st.markdown("""
-                <script>
-                document.addEventListener('DOMContentLoaded', () => {
-                    const audioElements = document.querySelectorAll('audio');
-                    audioElements.forEach((audio, index) => {
-                        audio.addEventListener('ended', () => {
-                            const nextAudio = audioElements[index + 1];
-                            if (nextAudio) {
-                                setTimeout(() => {
-                                    nextAudio.scrollIntoView({ behavior: 'smooth' });
-                                    nextAudio.play();
-                                }, 1500);
-                            }
-                        });
+        
+        st.divider()
+        
+        # Full text section
+        with st.expander(get_text('full_transcript'), expanded=True):
+            st.write(result['full_text'])
+        
+        # Time and resources of the processing stages
+        with st.expander(get_text('processing_metrics')):
+            st.table(result['metrics']['stages'])
+        
+        # Individual sentences with audio players
+        st.subheader(get_text('sentence_audio'))
+        
+        # Add autoplay toggle
+        col1, col2 = st.columns([1, 4])
+        with col1:
+            autoplay = st.checkbox(get_text('enable_autoplay'), help=get_text('autoplay_help'))
+        
+        # Create a container for the audio players
+        audio_container = st.container()
+        
+        with audio_container:
+            # Only the sentences of the current page are encoded and sent to the browser
+            sentence_count = len(result['sentences'])
+            col_size, col_page = st.columns([1, 1])
+            with col_size:
+                page_size = st.selectbox(get_text('sentences_per_page'), PAGE_SIZES)
+            with col_page:
+                page_count = max(ceil(sentence_count / page_size), 1)
+                page = st.number_input(get_text('page'), min_value=1, max_value=page_count, value=1)
+            first = (page - 1) * page_size
+            for i in range(first, min(first + page_size, sentence_count)):
+                sentence, audio_item = result['sentences'][i], result['audio_sentences'][i]
+                with st.container():
+                    st.markdown(f"**{i+1}.** {sentence}")
+                    
+                    # Show the audio player
+                    st.audio(
+                        get_audio_clip(file_hash, i, audio_item['audio'], result['audio_bitrate']),
+                        format="audio/mpeg"
+                    )
+                    
+                    # Show timing information
+                    st.caption(f"{get_text('time')} {audio_item['start_time']:.2f}s - {audio_item['end_time']:.2f}s")
+                    st.divider()
+            st.caption(f"{get_text('page')} {page} / {page_count}")
+        
+        # Add JavaScript for autoplay functionality if enabled
+        if autoplay:
+            st.markdown("""
+            <script>
+            document.addEventListener('DOMContentLoaded', () => {
+                const audioElements = document.querySelectorAll('audio');
+                audioElements.forEach((audio, index) => {
+                    audio.addEventListener('ended', () => {
+                        const nextAudio = audioElements[index + 1];
+                        if (nextAudio) {
+                            setTimeout(() => {
+                                nextAudio.scrollIntoView({ behavior: 'smooth' });
+                                nextAudio.play();
+                            }, 1500);
+                        }
                     });
                 });
-                </script>
-                """, unsafe_allow_html=True)
-    
+            });
+            </script>
+            """, unsafe_allow_html=True)
+
     # Add sidebar with information
     with st.sidebar:
         # Logout button
@@ -0,0 +1,31 @@
+import pytest
+from openai.types.audio import TranscriptionVerbose
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    # keep the tests away from the user transcription cache
+    path = tmp_path / "cache"
+    monkeypatch.setenv("SPEECH_SPLITTER_CACHE_DIR", str(path))
+    return path
+
+
+def hello_world(**params):
+    return TranscriptionVerbose(
+        duration=1.0,
+        text="Hello, world!",
+        language="english",
+        words=[
+            {"start": 0.0, "end": 0.5, "word": "Hello"},
+            {"start": 0.5, "end": 1.0, "word": "world"},
+        ],
+    )
+
+
+@pytest.fixture
+def transcriptions(mocker):
+    """The transcription requests of the mocked OpenAI client, answered with "Hello, world!" unless the test sets
+    another `side_effect`."""
+    client = mocker.patch("speech_splitter.backends.get_client").return_value
+    client.audio.transcriptions.create = mocker.AsyncMock(side_effect=hello_world)
+    return client.audio.transcriptions.create
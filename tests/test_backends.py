@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from speech_splitter.backends import ReplayBackend, create_backend, get_client
+from speech_splitter.splitter import main
+from speech_splitter.transport import Transport
+
+AUDIO_PATH = "./tests/data/audio.mp3"
+TRANSCRIPT = {
+    "language": "english",
+    "text": "Hello, world! How are you?",
+    "words": [
+        {"word": "Hello", "start": 1.0, "end": 1.5},
+        {"word": "world", "start": 1.5, "end": 2.0},
+        {"word": "How", "start": 20.0, "end": 20.3},
+        {"word": "are", "start": 20.3, "end": 20.5},
+        {"word": "you", "start": 20.5, "end": 21.0},
+    ],
+}
+
+
+@pytest.fixture
+def replay_path(tmp_path):
+    path = tmp_path / "transcript.json"
+    path.write_text(json.dumps(TRANSCRIPT))
+    return str(path)
+
+
+def test_get_client(monkeypatch):
+    # the module is importable without credentials, they're only required to create the client
+    transport = Transport()
+    monkeypatch.setattr("speech_splitter.transport._transport", transport)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with pytest.raises(ValueError):
+        get_client()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    assert get_client() is get_client() is transport.client
+    transport.close()
+
+
+def test_replay_backend(replay_path):
+    backend = create_backend("replay", replay_path)
+    assert isinstance(backend, ReplayBackend)
+    language, text, words = backend.transcribe(AUDIO_PATH)
+    assert (language, text, len(words)) == ("english", TRANSCRIPT["text"], 5)
+    # a chunk gets the words inside it, relative to its start
+    language, text, words = backend.transcribe(AUDIO_PATH, offset=19.5)
+    assert text == "How are you?"
+    assert [word.start for word in words] == pytest.approx([0.5, 0.8, 1.0])
+    assert [word.end for word in words] == pytest.approx([0.8, 1.0, 1.5])
+    with pytest.raises(ValueError):
+        create_backend("replay")
+
+
+def test_main_replay_backend(mocker, monkeypatch, tmp_path, replay_path):
+    # the whole pipeline runs offline, chunks included
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    output_path = tmp_path / "output"
+    argv = ["speech-split", AUDIO_PATH, str(output_path), "--chunk-length", "15", "--backend", "replay"]
+    mocker.patch("sys.argv", argv + ["--replay-file", replay_path])
+    main()
+    html_text = (output_path / "audio.html").read_text()
+    # the chunks keep the punctuation of the recording, which splits the sentences
+    assert "Hello, world!" in html_text
+    assert "How are you?" in html_text
+    assert len(list(output_path.glob("*.mp3"))) == 3
@@ -0,0 +1,47 @@
+import hashlib
+import io
+import os
+
+from openai.types.audio import TranscriptionWord
+
+from speech_splitter.cache import TranscriptionCache, copy_file, file_hash
+
+WORDS = [TranscriptionWord(word="Hello", start=0.0, end=0.5), TranscriptionWord(word="world", start=0.5, end=1.0)]
+
+
+def test_cache_roundtrip(cache_dir):
+    cache = TranscriptionCache()
+    key = cache.key("./tests/data/audio.mp3", model="whisper-1")
+    assert key == cache.key("./tests/data/audio.mp3", model="whisper-1")
+    assert key != cache.key("./tests/data/audio.mp3", model="other")
+    assert cache.get(key) is None
+    cache.set(key, "english", "Hello, world!", WORDS)
+    assert cache.get(key) == ("english", "Hello, world!", WORDS)
+    assert str(cache_dir) in cache.cache_dir
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = TranscriptionCache(str(tmp_path))
+    cache.set("first", "english", "Hello, world!", WORDS)
+    entry_size = os.path.getsize(os.path.join(cache.cache_dir, "first.json"))
+    cache.max_size = 2 * entry_size
+    cache.set("second", "english", "Hello, world!", WORDS)
+    os.utime(os.path.join(cache.cache_dir, "first.json"), (0, 0))
+    os.utime(os.path.join(cache.cache_dir, "second.json"), (1, 1))
+    # reading the first entry makes it the most recently used one
+    assert cache.get("first") is not None
+    cache.set("third", "english", "Hello, world!", WORDS)
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+
+
+def test_copy_file(tmp_path):
+    content = os.urandom(2500)
+    path = str(tmp_path / "copy")
+    digest = copy_file(io.BytesIO(content), path, block_size=1024)
+    assert digest == hashlib.sha256(content).hexdigest() == file_hash(path)
+    with open(path, "rb") as file:
+        assert file.read() == content
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from speech_splitter.energy import refine_boundaries
+from speech_splitter.pcm import PcmAudio
+
+FRAME_RATE = 16000
+
+
+def tone_and_silence():
+    # 1s of tone, 0.3s of silence, 1s of tone
+    tone = Sine(440).to_audio_segment(duration=1000).set_frame_rate(FRAME_RATE).set_channels(1).apply_gain(-3)
+    return tone + AudioSegment.silent(duration=300, frame_rate=FRAME_RATE) + tone
+
+
+@pytest.fixture(params=["segment", "pcm"])
+def audio(request, tmp_path):
+    segment = tone_and_silence()
+    if request.param == "segment":
+        return segment
+    path = str(tmp_path / "audio.pcm")
+    with open(path, "wb") as file:
+        file.write(segment.raw_data)
+    return PcmAudio(path, FRAME_RATE, 1)
+
+
+def test_refine_boundaries(audio):
+    # the boundaries in the tone snap into the nearest silence, the one in the silence stays in place
+    refined = refine_boundaries(audio, [0.95, 1.4, 1.15], radius=0.2)
+    assert 1.0 <= refined[0] <= 1.05
+    assert 1.25 <= refined[1] <= 1.3
+    assert refined[2] == pytest.approx(1.15, abs=0.01)
+
+
+def test_refine_boundaries_batches(audio):
+    times = np.linspace(0, 2.3, 50)
+    assert np.array_equal(refine_boundaries(audio, times, batch_size=7), refine_boundaries(audio, times))
+    assert np.array_equal(refine_boundaries(audio, times, radius=0), times)
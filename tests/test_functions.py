@@ -1,6 +1,19 @@
+import io
+import random
+
 import pytest
+from openai.types.audio import TranscriptionWord
+from pydub import AudioSegment
+from pydub.generators import Sine
 
-from speech_splitter.splitter import split_text_into_words
+from speech_splitter.splitter import (
+    align_sentences,
+    encode_audio,
+    encode_clips,
+    iter_encoded_audio,
+    merge_chunk_transcripts,
+    split_text_into_words,
+)
 
 
 @pytest.mark.parametrize(
@@ -93,3 +106,106 @@ from speech_splitter.splitter import split_text_into_words
 def test_split_text_into_words(language, text, expected):
     words = split_text_into_words(text, language)
     assert words == expected
+
+
+def test_merge_chunk_transcripts():
+    first = (
+        "english",
+        "Hello, world! How are",
+        [
+            TranscriptionWord(word="Hello", start=0.0, end=0.5),
+            TranscriptionWord(word="world", start=0.6, end=1.0),
+            TranscriptionWord(word="How", start=9.0, end=9.4),
+            TranscriptionWord(word="are", start=10.2, end=10.6),
+        ],
+    )
+    second = (
+        "english",
+        "How are you? Fine.",
+        [
+            TranscriptionWord(word="How", start=1.0, end=1.4),
+            TranscriptionWord(word="are", start=2.2, end=2.6),
+            TranscriptionWord(word="you", start=2.7, end=3.0),
+            TranscriptionWord(word="Fine", start=4.0, end=4.5),
+        ],
+    )
+    language, text, words = merge_chunk_transcripts([(0, 0, 10, first), (8, 10, float("inf"), second)])
+    assert language == "english"
+    assert text == "Hello, world! How are you? Fine."
+    assert [word.word for word in words] == ["Hello", "world", "How", "are", "you", "Fine"]
+    assert [word.start for word in words] == [0.0, 0.6, 9.0, 10.2, 10.7, 12.0]
+
+
+def _words(*texts):
+    return [TranscriptionWord(word=text, start=index, end=index + 0.5) for index, text in enumerate(texts)]
+
+
+def _dropped_words_case():
+    # random sentences, a stretch of words longer than the band missing from the transcript
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(5)) for _ in range(50)]
+    sentences = [[rng.choice(vocabulary) for _ in range(8)] for _ in range(50)]
+    texts = [word for sentence in sentences for word in sentence]
+    del texts[40:52]
+    expected = [(index * 8, index * 8 + 7) for index in range(5)] + [(40, 40), (40, 43)]
+    expected += [(index * 8 - 12, index * 8 - 5) for index in range(7, 50)]
+    return [" ".join(sentence) + "." for sentence in sentences], _words(*texts), expected
+
+
+def _drill_case():
+    # a repetitive drill with a sentence missing from the transcript
+    sentences = [f"Say the word {word}." for word in ["cat", "dog", "cow"] * 10]
+    texts = [word for index, sentence in enumerate(sentences) if index != 4 for word in sentence[:-1].split()]
+    expected = [(index * 4, index * 4 + 3) for index in range(4)] + [(16, 16)]
+    expected += [(index * 4 - 4, index * 4 - 1) for index in range(5, 30)]
+    return sentences, _words(*texts), expected
+
+
+@pytest.mark.parametrize(
+    "sentences, words, expected",
+    [
+        _dropped_words_case(),
+        _drill_case(),
+        (["Hello, world!", "How are you?"], _words("Hello", "world", "How", "are", "you"), [(0, 1), (2, 4)]),
+        # the transcript splits a word of the text in pieces
+        (["I can't.", "Bye."], _words("I", "can", "'t", "Bye"), [(0, 2), (3, 3)]),
+        # a word joined in the transcript is split by the tokenizer
+        (["Well, one two.", "Three."], _words("Well", "onetwo", "Three"), [(0, 1), (2, 2)]),
+        # an extra word in the transcript
+        (["Hello world.", "How are you?"], _words("Hello", "um", "world", "How", "are", "you"), [(0, 2), (3, 5)]),
+        # a word missing from the transcript
+        (["One two three four.", "Five six."], _words("One", "two", "four", "Five", "six"), [(0, 2), (3, 4)]),
+        # a word transcribed differently doesn't shift the following sentences
+        (["Hé, ça va?", "Oui, très bien."], _words("Hey", "ça", "va", "Oui", "très", "bien"), [(0, 2), (3, 5)]),
+        # a sentence without words
+        (["Hello.", "...", "Bye."], _words("Hello", "Bye"), [(0, 0), (1, 1), (1, 1)]),
+    ],
+)
+def test_align_sentences(sentences, words, expected):
+    assert align_sentences(sentences, words, "english") == expected
+
+
+def test_align_sentences_mismatch_does_not_cascade():
+    sentences = ["Dat is het.", "Zo'n ding heb ik niet."] + [f"Zin nummer {i}." for i in range(100)]
+    texts = ["Dat", "is", "het", "Zo", "'n", "ding", "heb", "ik", "niet"]
+    for i in range(100):
+        texts += ["Zin", "nummer", str(i)]
+    spans = align_sentences(sentences, _words(*texts), "dutch")
+    assert spans[1] == (3, 8)
+    assert spans[-1] == (len(texts) - 3, len(texts) - 1)
+
+
+def test_encode_clips():
+    segments = [Sine(440).to_audio_segment(duration=duration) for duration in (200, 1000, 500)]
+    clips = list(encode_clips(segments, "64k", max_workers=2))
+    assert clips == [encode_audio(segment, bitrate="64k") for segment in segments]
+    assert [round(AudioSegment.from_file(io.BytesIO(clip)).duration_seconds, 1) for clip in clips] == [0.2, 1.0, 0.5]
+
+
+@pytest.mark.parametrize("codec, format", [("wav", "wav"), ("mp3", "mp3"), ("opus", "ogg"), ("flac", "flac")])
+@pytest.mark.parametrize("channels, bitrate", [(1, "64k"), (2, "1411k")])
+def test_iter_encoded_audio(codec, format, channels, bitrate):
+    # also at the bit rate of 44.1 kHz stereo WAV, beyond what libopus accepts
+    segment = Sine(440, sample_rate=44100).to_audio_segment(duration=1000).set_channels(channels)
+    data = b"".join(iter_encoded_audio(segment, codec, bitrate, block_size=1024))
+    assert round(AudioSegment.from_file(io.BytesIO(data), format=format).duration_seconds, 1) == 1.0
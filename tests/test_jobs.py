@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from speech_splitter.jobs import DONE, FAILED, JobQueue
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=2)
+    yield queue
+    queue.shutdown()
+
+
+def wait(job, timeout=5):
+    for _ in range(timeout * 100):
+        if job.done:
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(job.id)
+
+
+def test_job_queue(queue):
+    """Test that the job runs in the background, reporting its stages, and is found by its ID."""
+    release = threading.Event()
+
+    def process(value, progress):
+        progress("first")
+        release.wait(5)
+        progress("second")
+        return value * 2
+
+    job, submitted = queue.submit("a", process, 21)
+    assert submitted
+    for _ in range(500):
+        if job.stage == "first":
+            break
+        time.sleep(0.01)
+    assert job.stage == "first"
+    assert not job.done
+    # the same job is returned for the same ID, not run again
+    assert queue.submit("a", process, 0) == (job, False)
+    release.set()
+    wait(job)
+    assert (job.status, job.stage, job.result) == (DONE, "second", 42)
+    assert queue.get("a") is job
+    assert queue.get("b") is None
+
+
+def test_job_queue_failure(queue):
+    """Test that the error of a failed job is kept, and that it's retried when submitted again."""
+
+    def fail(progress):
+        raise ValueError("invalid")
+
+    job = wait(queue.submit("a", fail)[0])
+    assert job.status == FAILED
+    assert isinstance(job.error, ValueError)
+    retry = wait(queue.submit("a", lambda progress: "ok")[0])
+    assert retry is not job
+    assert (retry.status, retry.result) == (DONE, "ok")
+
+
+def test_job_queue_eviction():
+    """Test that only the most recent finished jobs are kept, and not longer than the TTL."""
+    queue = JobQueue(max_workers=1, max_finished=2)
+    try:
+        for job_id in "abc":
+            wait(queue.submit(job_id, lambda progress: None)[0])
+        assert [queue.get(job_id) is not None for job_id in "abc"] == [False, True, True]
+        queue.ttl = -1
+        assert queue.get("c") is None
+    finally:
+        queue.shutdown()
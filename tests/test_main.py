@@ -1,23 +1,16 @@
-from openai.types.audio.transcription import Transcription
-from speech_splitter.splitter import main
+import base64
+import json
+import os
 
+import pytest
+from openai.types.audio import TranscriptionVerbose
+from pydub import AudioSegment
+from pydub.utils import mediainfo
 
-def test_main(mocker, tmp_path):
-    def create_transcription(**params):
-        return Transcription(
-            text="Hello, world!",
-            language="english",
-            words=[
-                {"start": 0.0, "end": 0.5, "word": "Hello"},
-                {"start": 0.5, "end": 1.0, "word": "world"},
-            ],
-        )
+from speech_splitter.splitter import main, transcribe_audio
 
-    patched = mocker.patch(
-        # api_call is from slow.py but imported to main.py
-        "speech_splitter.splitter.client.audio.transcriptions.create",
-        side_effect=create_transcription,
-    )
+
+def test_main(transcriptions, mocker, tmp_path):
     input_path = "./tests/data/audio.mp3"
     output_path = str(tmp_path / "output")
     mocker.patch(
@@ -29,9 +22,178 @@ def test_main(mocker, tmp_path):
         ],
     )
     main()
-    assert patched.call_count == 1
+    assert transcriptions.call_count == 1
     html_path = tmp_path / "output" / "audio.html"
     assert html_path.exists()
     html_text = html_path.read_text()
     assert "Hello, world!" in html_text
     assert "<audio" in html_text
+    # the clips are loaded from the files next to the page
+    assert (tmp_path / "output" / "Hello, world!.mp3").exists()
+    assert 'src="Hello%2C%20world%21.mp3"' in html_text
+    assert 'src="audio_full.mp3"' in html_text
+    assert "base64" not in html_text
+
+
+def test_transcribe_audio_chunked(transcriptions):
+    # the test audio is ~40s long, so 15s chunks give several overlapping windows transcribed by separate requests
+    def create_transcription(**params):
+        return TranscriptionVerbose(
+            duration=17.0,
+            text="One, two. Three.",
+            language="english",
+            words=[
+                {"start": 1.0, "end": 1.5, "word": "One"},
+                {"start": 8.0, "end": 8.5, "word": "two"},
+                {"start": 16.5, "end": 16.9, "word": "Three"},
+            ],
+        )
+
+    transcriptions.side_effect = create_transcription
+    language, text, words = transcribe_audio("./tests/data/audio.mp3", chunk_length=15, max_workers=2)
+    assert transcriptions.call_count >= 3
+    assert language == "english"
+    starts = [word.start for word in words]
+    assert starts == sorted(starts)
+    # the words falling into the overlaps are kept only once
+    assert len(words) < 3 * transcriptions.call_count
+    assert text.startswith("One, two.")
+    assert len(text.split()) == len(words)
+
+
+@pytest.mark.parametrize("chunk_length", [0, 600])
+def test_transcribe_audio_upload_size(transcriptions, mocker, tmp_path, chunk_length):
+    # uncompressed audio longer than the upload limit, but shorter than a chunk, is split nevertheless
+    def create_transcription(file, **params):
+        sizes.append(os.path.getsize(file.name))
+        return hello_world(**params)
+
+    sizes, hello_world = [], transcriptions.side_effect
+    transcriptions.side_effect = create_transcription
+    mocker.patch("speech_splitter.splitter.MAX_UPLOAD_SIZE", 1024 * 1024)
+    audio_path = str(tmp_path / "audio.wav")
+    # 44.1 kHz stereo, ~7 MB
+    AudioSegment.from_file("./tests/data/audio.mp3").set_channels(2).export(audio_path, format="wav")
+    transcribe_audio(audio_path, chunk_length=chunk_length)
+    assert len(sizes) >= 7
+    assert max(sizes) < 1024 * 1024
+
+
+@pytest.mark.parametrize("chunk_length", [0, 15])
+def test_transcribe_audio_upload_format(transcriptions, chunk_length):
+    def create_transcription(file, **params):
+        uploaded.append(file.name)
+        assert AudioSegment.from_file(file.name).channels == 1
+        return TranscriptionVerbose(
+            duration=1.0,
+            text="Hello.",
+            language="english",
+            words=[{"start": 0.5, "end": 1.0, "word": "Hello"}],
+        )
+
+    uploaded = []
+    transcriptions.side_effect = create_transcription
+    language, text, words = transcribe_audio("./tests/data/audio.mp3", chunk_length=chunk_length, upload_format="opus")
+    assert uploaded and all(name.endswith(".ogg") for name in uploaded)
+    assert words[0].start == 0.5
+
+
+def test_main_uses_cache(transcriptions, mocker, tmp_path):
+    argv = ["speech-split", "./tests/data/audio.mp3", str(tmp_path / "output")]
+    mocker.patch("sys.argv", argv)
+    main()
+    main()
+    assert transcriptions.call_count == 1
+    mocker.patch("sys.argv", argv + ["--no-cache"])
+    main()
+    assert transcriptions.call_count == 2
+    mocker.patch("sys.argv", argv + ["--clear-cache"])
+    main()
+    assert transcriptions.call_count == 3
+
+
+def test_main_batch(transcriptions, mocker, tmp_path):
+    invalid_path = tmp_path / "invalid.mp3"
+    invalid_path.write_bytes(b"not an audio")
+    output_path = tmp_path / "output"
+    mocker.patch("sys.argv", ["speech-split", str(invalid_path), "./tests/data/audio.mp3", str(output_path), "--jobs", "2"])
+    # an invalid input fails on its own, after the other files are processed
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+    assert exc_info.value.code == 1
+    assert (output_path / "audio.html").exists()
+    assert not (output_path / "invalid.html").exists()
+
+
+@pytest.mark.parametrize("media", ["embed", "fragments"])
+def test_main_media(transcriptions, mocker, tmp_path, media):
+    output_path = tmp_path / "output"
+    mocker.patch("sys.argv", ["speech-split", "./tests/data/audio.mp3", str(output_path), "--media", media])
+    main()
+    html_text = (output_path / "audio.html").read_text()
+    if media == "embed":
+        # the sentence clip is encoded once, for both the file and the embedded player
+        clip = (output_path / "Hello, world!.mp3").read_bytes()
+        assert base64.b64encode(clip).decode("utf-8") in html_text
+        source = open("./tests/data/audio.mp3", "rb").read()
+        assert base64.b64encode(source).decode("utf-8") in html_text
+    else:
+        assert not (output_path / "Hello, world!.mp3").exists()
+        assert (output_path / "audio_full.mp3").exists()
+        assert 'src="audio_full.mp3#t=0.000,1.300"' in html_text
+
+
+@pytest.mark.parametrize(
+    "slicing, end, duration",
+    [("seek", None, 29.7), ("pcm", None, 29.7), ("memory", None, 29.7), ("seek", "25", 15), ("memory", "25", 15)],
+)
+def test_main_offset(transcriptions, mocker, tmp_path, slicing, end, duration):
+    output_path = tmp_path / "output"
+    argv = ["speech-split", "./tests/data/audio.mp3", str(output_path), "--offset", "10", "--slicing", slicing]
+    if end:
+        argv += ["--end", end]
+    mocker.patch("sys.argv", argv)
+    main()
+    clip = AudioSegment.from_file(output_path / "Hello, world!.mp3")
+    assert abs(clip.duration_seconds - 1.3) < 0.1
+    # the excerpt is copied without re-encoding, so it's only accurate to the audio frames
+    source = AudioSegment.from_file(output_path / "audio_full.mp3")
+    assert abs(source.duration_seconds - duration) < 0.1
+    bit_rate = int(mediainfo(str(output_path / "audio_full.mp3"))["bit_rate"]) // 1000
+    assert bit_rate == int(mediainfo("./tests/data/audio.mp3")["bit_rate"]) // 1000
+
+
+def test_transcribe_audio_trim_silence(transcriptions):
+    # the test audio has no long pause, add one in the middle
+    audio = AudioSegment.from_file("./tests/data/audio.mp3")[:5000]
+    audio = audio + AudioSegment.silent(4000, audio.frame_rate).set_channels(audio.channels) + audio
+
+    def create_transcription(file, **params):
+        trimmed = AudioSegment.from_file(file.name)
+        assert trimmed.duration_seconds < audio.duration_seconds - 3
+        return TranscriptionVerbose(
+            duration=trimmed.duration_seconds,
+            text="Hello.",
+            language="english",
+            words=[{"start": trimmed.duration_seconds - 1, "end": trimmed.duration_seconds - 0.5, "word": "Hello"}],
+        )
+
+    transcriptions.side_effect = create_transcription
+    language, text, words = transcribe_audio("./tests/data/audio.mp3", audio=audio, trim_silence=True)
+    # the timestamps index the original audio, not the trimmed one
+    assert words[0].start == pytest.approx(audio.duration_seconds - 1, abs=0.1)
+
+
+def test_main_metrics(transcriptions, mocker, tmp_path):
+    metrics_path = tmp_path / "metrics.json"
+    argv = ["speech-split", "./tests/data/audio.mp3", str(tmp_path / "output"), "--chunk-length", "15"]
+    mocker.patch("sys.argv", argv + ["--metrics-out", str(metrics_path)])
+    main()
+    [report] = json.loads(metrics_path.read_text())
+    stages = {stage["stage"]: stage for stage in report["stages"]}
+    assert list(stages) == ["input", "decoding", "transcription", "alignment", "encoding"]
+    # the chunks are uploaded from the worker threads
+    assert stages["transcription"]["bytes_uploaded"] >= os.path.getsize("./tests/data/audio.mp3")
+    output_size = sum(path.stat().st_size for path in (tmp_path / "output").iterdir())
+    assert stages["encoding"]["bytes_written"] == output_size
+    assert report["total"]["wall_time"] >= stages["transcription"]["wall_time"] > 0
@@ -0,0 +1,83 @@
+import os
+import pickle
+
+import pytest
+from pydub import AudioSegment
+
+from speech_splitter.media import (
+    AudioFile,
+    audio_stream_info,
+    cut_audio,
+    extract_audio,
+    media_type,
+    run_ffmpeg,
+    transcode_for_upload,
+)
+
+AUDIO_PATH = "./tests/data/audio.mp3"
+
+
+def test_audio_file_slicing():
+    audio = AudioFile(AUDIO_PATH)
+    assert round(audio.duration_seconds) == 40
+    clip = audio[1000:3500]
+    assert len(clip) == 2500
+    assert len(clip[500:]) == 2000
+    assert len(audio[39000:50000]) == len(audio) - 39000
+    # views are cheap to send to worker processes
+    clip = pickle.loads(pickle.dumps(clip))
+    segment = clip.decode()
+    assert abs(len(segment) - 2500) < 30
+    assert segment.raw_data == clip.raw_data
+    reference = AudioSegment.from_file(AUDIO_PATH)[1000:3500]
+    assert abs(segment.dBFS - reference.dBFS) < 1
+    with pytest.raises(TypeError):
+        audio[1000]
+
+
+@pytest.mark.parametrize("copy", [True, False])
+def test_cut_audio(tmp_path, copy):
+    output_path = cut_audio(AUDIO_PATH, str(tmp_path / "cut.mp3"), 10, 15.5, copy=copy)
+    assert abs(AudioSegment.from_file(output_path).duration_seconds - 5.5) < 0.1
+
+
+@pytest.mark.parametrize("upload_format", ["opus", "mp3"])
+def test_transcode_for_upload(tmp_path, upload_format):
+    output_path = transcode_for_upload(AUDIO_PATH, str(tmp_path), upload_format)
+    reference = AudioSegment.from_file(AUDIO_PATH)
+    audio = AudioSegment.from_file(output_path)
+    assert audio.channels == 1
+    # the timeline is kept, so the timestamps still index the original audio
+    assert abs(audio.duration_seconds - reference.duration_seconds) < 0.1
+    assert os.path.getsize(output_path) < os.path.getsize(AUDIO_PATH)
+
+
+@pytest.mark.parametrize("audio_codec, extension", [("aac", ".m4a"), ("ac3", ".mp3")])
+def test_extract_audio(tmp_path, audio_codec, extension):
+    video_path = str(tmp_path / "video.mp4")
+    run_ffmpeg(
+        *("-f", "lavfi", "-i", "testsrc=duration=3:size=64x64:rate=5"),
+        *("-f", "lavfi", "-i", "sine=frequency=440:duration=3"),
+        *("-c:v", "libx264", "-c:a", audio_codec, "-shortest", video_path),
+    )
+    audio_path = extract_audio(video_path, str(tmp_path))
+    # the audio stream is copied when its codec has a container, and re-encoded otherwise
+    assert audio_path.endswith(extension)
+    assert audio_stream_info(audio_path)["codec_name"] == ("aac" if audio_codec == "aac" else "mp3")
+    assert abs(AudioSegment.from_file(audio_path).duration_seconds - 3) < 0.1
+
+
+def test_media_type(tmp_path):
+    """Test that the media type is sniffed from the content of the file, not from its extension."""
+    video_path = str(tmp_path / "video.mp4")
+    run_ffmpeg("-f", "lavfi", "-i", "testsrc=duration=1:size=64x64:rate=5", "-c:v", "libx264", video_path)
+    # an audio file with cover art is still an audio file
+    cover_path = str(tmp_path / "cover.mp3")
+    run_ffmpeg("-i", AUDIO_PATH, "-i", video_path, "-map", "0:a", "-map", "1:v", "-c:a", "copy", "-c:v", "mjpeg", cover_path)
+    text_path = tmp_path / "text.mp3"
+    text_path.write_text("not a media file")
+    os.rename(video_path, str(tmp_path / "video.ogg"))
+    assert media_type(str(tmp_path / "video.ogg")) == "video"
+    assert media_type(AUDIO_PATH) == "audio"
+    assert media_type(cover_path) == "audio"
+    assert media_type(str(text_path)) is None
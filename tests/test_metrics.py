@@ -0,0 +1,18 @@
+from speech_splitter.metrics import Metrics, record
+
+
+def test_metrics_stages():
+    finished = []
+    metrics = Metrics("audio.mp3", hook=lambda name, stage: finished.append((name, stage["stage"])))
+    # recorded outside of a stage, ignored
+    record("bytes_written", 10)
+    with metrics.stage("transcription"):
+        record("bytes_uploaded", 100)
+        record("bytes_uploaded", 20)
+    with metrics.stage("encoding"):
+        record("bytes_written", 5)
+    assert finished == [("audio.mp3", "transcription"), ("audio.mp3", "encoding")]
+    report = metrics.as_dict()
+    assert [stage["bytes_uploaded"] for stage in report["stages"]] == [120, 0]
+    assert report["total"]["bytes_written"] == 5
+    assert report["total"]["wall_time"] >= 0
@@ -0,0 +1,51 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from speech_splitter.pcm import PcmAudio, PcmCache
+
+AUDIO_PATH = "./tests/data/audio.mp3"
+
+
+def test_pcm_cache_decodes_once(mocker):
+    cache = PcmCache()
+    audio = cache.load(AUDIO_PATH)
+    reference = AudioSegment.from_file(AUDIO_PATH)
+    assert (audio.frame_rate, audio.channels) == (reference.frame_rate, reference.channels)
+    assert abs(len(audio) - len(reference)) < 50
+    run_ffmpeg = mocker.patch("speech_splitter.pcm.run_ffmpeg")
+    assert cache.load(AUDIO_PATH).path == audio.path
+    assert not run_ffmpeg.called
+    # another sample format is another entry
+    cache.load(AUDIO_PATH, frame_rate=8000)
+    assert run_ffmpeg.called
+
+
+def test_pcm_audio_views(tmp_path):
+    path = str(tmp_path / "audio.pcm")
+    samples = (np.sin(np.arange(16000) / 10) * 10000).astype("<i2")
+    samples.tofile(path)
+    audio = PcmAudio(path, frame_rate=8000, channels=1)
+    assert len(audio) == 2000
+    clip = audio[500:1500]
+    assert len(clip) == 1000
+    assert len(clip[:250]) == 250
+    # views share the memory map of the file
+    assert np.shares_memory(clip.array, audio.array)
+    assert bytes(clip.raw_data) == samples[4000:12000].tobytes()
+    segment = clip.decode()
+    assert segment.raw_data == samples[4000:12000].tobytes()
+    assert clip.dBFS == pytest.approx(segment.dBFS, abs=0.01)
+    assert audio[100:100].dBFS == -float("inf")
+    clip = pickle.loads(pickle.dumps(clip))
+    assert bytes(clip.raw_data) == samples[4000:12000].tobytes()
+
+
+def test_pcm_cache_clear():
+    cache = PcmCache()
+    audio = cache.load(AUDIO_PATH)
+    cache.clear()
+    assert not os.path.exists(audio.path)
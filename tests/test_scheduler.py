@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from speech_splitter.scheduler import InputTooLarge, Resource, Scheduler, estimate_memory
+
+AUDIO_PATH = "./tests/data/audio.mp3"
+
+
+def wait_until(condition, timeout=5):
+    for _ in range(timeout * 100):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise TimeoutError
+
+
+def test_resource_order():
+    """Test that the requests are admitted in their order of arrival, reporting their position while waiting."""
+    resource = Resource("memory", 10)
+    admitted, positions = [], {}
+    first = resource.acquire(8)
+    first.__enter__()
+
+    def request(name, amount):
+        with resource.acquire(amount, waiting=lambda position: positions.setdefault(name, position)):
+            admitted.append(name)
+
+    big = threading.Thread(target=request, args=("big", 10))
+    big.start()
+    wait_until(lambda: resource.waiting == 1)
+    # fits right now, but waits for the bigger request that arrived earlier
+    small = threading.Thread(target=request, args=("small", 2))
+    small.start()
+    wait_until(lambda: resource.waiting == 2)
+    assert admitted == []
+    assert positions == {"big": 1, "small": 2}
+    first.__exit__(None, None, None)
+    big.join(5)
+    small.join(5)
+    assert admitted == ["big", "small"]
+    assert (resource.used, resource.waiting) == (0, 0)
+
+
+def test_resource_too_large():
+    """Test that a request bigger than the capacity is rejected right away."""
+    with pytest.raises(InputTooLarge):
+        with Resource("memory", 10).acquire(11):
+            pass
+
+
+def test_scheduler_slot():
+    """Test that the stages are limited to their number of slots, and the others not at all."""
+    scheduler = Scheduler({"decoding": 1, "encoding": None})
+    with scheduler.slot("decoding"):
+        assert scheduler.resources["decoding"].used == 1
+        with scheduler.slot("encoding"), scheduler.slot("alignment"):
+            pass
+    assert scheduler.resources["decoding"].used == 0
+    assert "encoding" not in scheduler.resources
+
+
+def test_scheduler_reserve():
+    """Test that the memory of the decoded audio is estimated from its duration and sample format."""
+    memory = estimate_memory(AUDIO_PATH)
+    # a 40 seconds mono recording at 44.1 kHz, 16 bits per sample
+    assert memory == pytest.approx(40 * 44100 * 2, rel=0.01)
+    scheduler = Scheduler(memory_budget=memory)
+    with scheduler.reserve(AUDIO_PATH):
+        assert scheduler.memory.used == memory
+    with pytest.raises(InputTooLarge, match="too long"):
+        Scheduler(memory_budget=memory - 1).reserve(AUDIO_PATH)
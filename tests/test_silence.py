@@ -0,0 +1,43 @@
+import pytest
+from openai.types.audio import TranscriptionWord
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from speech_splitter.pcm import PcmAudio
+from speech_splitter.silence import find_speech_regions, remap_words, trim_silences
+
+FRAME_RATE = 16000
+
+
+@pytest.fixture(params=["segment", "pcm"])
+def audio(request, tmp_path):
+    # 1s of tone, 3s of silence, 1s of tone, 0.5s of silence, 1s of tone
+    tone = Sine(440).to_audio_segment(duration=1000).set_frame_rate(FRAME_RATE).set_channels(1).apply_gain(-3)
+    segment = tone + AudioSegment.silent(3000, FRAME_RATE) + tone + AudioSegment.silent(500, FRAME_RATE) + tone
+    if request.param == "segment":
+        return segment
+    path = str(tmp_path / "audio.pcm")
+    with open(path, "wb") as file:
+        file.write(segment.raw_data)
+    return PcmAudio(path, FRAME_RATE, 1)
+
+
+def test_find_speech_regions(audio):
+    # only the long silence is removed, keeping a margin around the speech
+    assert find_speech_regions(audio, min_silence=1.0, padding=0.25) == [(0, 1250), (3750, 6500)]
+
+
+def test_trim_silences(audio, tmp_path):
+    output_path = str(tmp_path / "trimmed.wav")
+    offset_map = trim_silences(audio, [(0, 1250), (3750, 6500)], output_path)
+    assert offset_map == [(0.0, 0.0), (1.25, 3.75)]
+    assert AudioSegment.from_file(output_path).duration_seconds == pytest.approx(4.0, abs=0.01)
+
+
+def test_remap_words():
+    offset_map = [(0.0, 0.0), (1.25, 3.75)]
+    words = [
+        TranscriptionWord(word="One", start=0.2, end=1.25),
+        TranscriptionWord(word="two", start=1.25, end=2.0),
+    ]
+    assert [(word.start, word.end) for word in remap_words(words, offset_map)] == [(0.2, 1.25), (3.75, 4.5)]
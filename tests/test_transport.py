@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import httpx
+import openai
+import pytest
+
+from speech_splitter.transport import TokenBucket, Transport, configure_transport, get_transport, is_transient, retry_after
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/audio/transcriptions")
+
+
+def status_error(status_code, headers=None):
+    response = httpx.Response(status_code, headers=headers, request=REQUEST)
+    error_class = {400: openai.BadRequestError, 429: openai.RateLimitError}.get(status_code, openai.InternalServerError)
+    return error_class("error", response=response, body=None)
+
+
+def test_is_transient():
+    assert is_transient(openai.APIConnectionError(request=REQUEST))
+    assert is_transient(openai.APITimeoutError(request=REQUEST))
+    assert is_transient(status_error(429))
+    assert is_transient(status_error(503))
+    assert not is_transient(status_error(400))
+    assert not is_transient(ValueError())
+    assert retry_after(status_error(429, {"retry-after": "2"})) == 2
+    assert retry_after(status_error(429)) is None
+
+
+def test_transport_retries(mocker):
+    """Test that the transient errors are retried after a backoff, honoring the delay asked by the server."""
+    sleep = mocker.patch("speech_splitter.transport.asyncio.sleep", mocker.AsyncMock())
+    errors = [status_error(429, {"retry-after": "7"}), openai.APIConnectionError(request=REQUEST)]
+
+    async def request(value):
+        if errors:
+            raise errors.pop(0)
+        return value
+
+    transport = Transport(retries=2, backoff=0.5)
+    assert transport.run(request, "done") == "done"
+    delays = [call.args[0] for call in sleep.call_args_list]
+    assert delays[0] == 7
+    assert 0 <= delays[1] <= 1
+
+
+def test_transport_gives_up(mocker):
+    """Test that the errors are raised after the last retry, and right away when they aren't transient."""
+    mocker.patch("speech_splitter.transport.asyncio.sleep", mocker.AsyncMock())
+    calls = []
+
+    async def request(error):
+        calls.append(error)
+        raise error
+
+    transport = Transport(retries=2)
+    with pytest.raises(openai.InternalServerError):
+        transport.run(request, status_error(500))
+    assert len(calls) == 3
+    with pytest.raises(openai.BadRequestError):
+        transport.run(request, status_error(400))
+    assert len(calls) == 4
+
+
+def test_transport_concurrency():
+    """Test that the requests made from many threads share the event loop, with at most `concurrency` in flight."""
+    in_flight, peak = [0], [0]
+
+    async def request():
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return threading.current_thread().name
+
+    transport = Transport(concurrency=2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(transport.run(request))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["transport"] * 6
+    assert peak[0] == 2
+
+
+def test_transport_gather(mocker):
+    """Test that the gathered requests take a slot and are retried each on its own, even with a single slot."""
+    mocker.patch("speech_splitter.transport.asyncio.sleep", mocker.AsyncMock())
+    calls = []
+
+    async def request(value):
+        calls.append(value)
+        if calls.count(value) == 1 and value == 2:
+            raise openai.APIConnectionError(request=REQUEST)
+        return value
+
+    transport = Transport(concurrency=1)
+    assert transport.gather(request, [(value,) for value in range(4)]) == [0, 1, 2, 3]
+    assert sorted(calls) == [0, 1, 2, 2, 3]
+
+
+def test_transport_client(monkeypatch):
+    """Test that the client is created on the event loop of its transport, and closed along with it when replaced."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr("speech_splitter.transport._transport", None)
+    first = configure_transport()
+    client = first.client
+    loop = first._start()
+
+    async def request():
+        return first.client, asyncio.get_running_loop()
+
+    assert first.run(request) == (client, loop)
+    second = configure_transport(concurrency=2)
+    assert get_transport() is second
+    assert client.is_closed() and loop.is_closed()
+    assert second.client is not client
+    second.close()
+
+
+def test_token_bucket(mocker):
+    monotonic = mocker.patch("speech_splitter.transport.time.monotonic", return_value=0)
+    bucket = TokenBucket(rate=2, capacity=2)
+    # a burst of the capacity goes through, then the requests are spaced by 1 / rate
+    assert [bucket.delay() for _ in range(4)] == [0, 0, 0.5, 1]
+    monotonic.return_value = 10
+    assert bucket.delay() == 0
@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from speech_splitter.splitter import main, text_to_speech
+from speech_splitter.transport import Transport
+from speech_splitter.tts import FRAME_RATE, MAX_INPUT_LENGTH, PAUSE, split_input
+
+TEXT = "Hello there. This is a much longer sentence, said slowly. Bye!"
+
+
+class Speech:
+    """Streamed response of the speech API: a tone of 50ms per character of the input, as raw PCM."""
+
+    requests = []
+
+    def __init__(self, input, response_format, **params):
+        assert response_format == "pcm"
+        self.requests.append(input)
+        self.input = input
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def stream_to_file(self, path):
+        samples = 8000 * np.sin(2 * np.pi * 440 * np.arange(len(self.input) * FRAME_RATE // 20) / FRAME_RATE)
+        with open(path, "wb") as file:
+            file.write(samples.astype("<i2").tobytes())
+
+
+@pytest.fixture
+def speech(mocker):
+    Speech.requests = []
+    client = mocker.patch("speech_splitter.tts.get_client").return_value
+    client.audio.speech.with_streaming_response.create = Speech
+    return Speech
+
+
+def test_split_input():
+    long_sentence = " ".join(["word"] * (MAX_INPUT_LENGTH // 4))
+    inputs = split_input(["Short one.", long_sentence, "x" * (MAX_INPUT_LENGTH + 1)])
+    assert inputs[0] == (0, "Short one.")
+    # the long sentence is split between its words, the long word cut
+    assert [index for index, _ in inputs] == [0, 1, 1, 2, 2]
+    assert all(len(text) <= MAX_INPUT_LENGTH for _, text in inputs)
+    assert " ".join(text for index, text in inputs if index == 1) == long_sentence
+
+
+def test_text_to_speech(speech, tmp_path):
+    text_path = tmp_path / "text.txt"
+    text_path.write_text(TEXT)
+    audio_path, (language, text, words) = text_to_speech(str(text_path), str(tmp_path))
+    assert speech.requests == ["Hello there.", "This is a much longer sentence, said slowly.", "Bye!"]
+    assert (language, text) == ("english", TEXT)
+    assert [word.word for word in words][:3] == ["Hello", "there", "This"]
+    # the sentences are separated by pauses, and their bounds are exact
+    characters = [len(sentence) for sentence in speech.requests]
+    assert words[0].start == pytest.approx(PAUSE)
+    assert words[1].end == pytest.approx(PAUSE + characters[0] / 20)
+    assert words[2].start == pytest.approx(2 * PAUSE + characters[0] / 20)
+    assert words[-1].end == pytest.approx(3 * PAUSE + sum(characters) / 20)
+    assert all(word.start < word.end for word in words)
+    duration = AudioSegment.from_file(audio_path).duration_seconds
+    assert duration == pytest.approx(4 * PAUSE + sum(characters) / 20, abs=0.1)
+
+
+def test_text_to_speech_single_slot(speech, mocker, tmp_path):
+    """Test that the sentences are synthesized one at a time when the transport has a single slot."""
+    mocker.patch("speech_splitter.tts.get_transport", return_value=Transport(concurrency=1))
+    text_path = tmp_path / "text.txt"
+    text_path.write_text(TEXT)
+    thread = threading.Thread(target=text_to_speech, args=(str(text_path), str(tmp_path)), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(speech.requests) == 3
+
+
+def test_main_text(speech, mocker, tmp_path):
+    """Test that the speech synthesized from a text is split without transcribing it."""
+    transcriptions = mocker.patch("speech_splitter.backends.get_client").return_value.audio.transcriptions.create
+    text_path = tmp_path / "text.txt"
+    text_path.write_text(TEXT)
+    output_path = tmp_path / "output"
+    mocker.patch("sys.argv", ["speech-split", str(text_path), str(output_path), "--no-cache"])
+    main()
+    assert not transcriptions.called
+    html = (output_path / "text.html").read_text()
+    assert "This is a much longer sentence, said slowly." in html
+    assert len(list(output_path.glob("*.mp3"))) == 4